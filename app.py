@@ -4,12 +4,22 @@
 #   - /v1/ffmpeg/compose
 #   - /v1/code/execute/python
 #   - /v1/toolkit/test, /v1/toolkit/authenticate
-#   - /v1/toolkit/job/status, /v1/toolkit/jobs/status
+#   - /v1/toolkit/job/status, /v1/toolkit/jobs/status, /v1/toolkit/job/cancel
+#   - /v1/toolkit/metrics
 #   - /v1/s3/upload, /v1/gcp/upload
 
 from flask import Flask, request, jsonify
-from queue import Queue
-from services.webhook import send_webhook
+from services.webhook import send_webhook, webhook_dispatcher
+from services.job_executor import JobExecutor, POOL_CPU
+from services.job_scheduler import get_job_tenant, parse_priority
+from services.job_cost import estimate_job_cost
+from services.job_journal import job_journal, JOB_JOURNAL_MAX_ATTEMPTS, JOB_JOURNAL_REPLAY_RETRY_SECONDS
+from services.admission import admission, estimate_job_resources, ADMISSION_RETRY_AFTER
+from services.job_control import (
+    job_context, get_job_timeout, cancel_job as cancel_running_job, start_cancel_watcher,
+    JobCancelled, JOB_STOP_CODES, JOB_KILL_GRACE_SECONDS
+)
+from services.v1.ffmpeg.ffmpeg_compose import is_gpu_available, get_prefetch_urls, resolve_stream_inputs
 import threading
 import uuid
 import os
@@ -24,17 +34,21 @@ print("🚀 NCA-GPU-LEAN STARTUP: LOADING SYSTEM...")
 
 from version import BUILD_NUMBER
 from app_utils import log_job_status
+from services.job_store import job_store
+from services.scratch import sweep_scratch_orphans
+from services.prefetch import prefetcher
+from services.storage_clients import storage_clients
+from config import API_KEY
 
 MAX_QUEUE_LENGTH = int(os.environ.get('MAX_QUEUE_LENGTH', 0))
+# Run synchronous (non-webhook) jobs on the executor pools instead of the
+# request thread, so they share the pools' slot limits with queued jobs.
+SYNC_JOBS_IN_POOL = os.environ.get('SYNC_JOBS_IN_POOL', 'true').lower() in ['true', '1']
 
 
 def create_app():
     app = Flask(__name__)
 
-    # Create a queue to hold tasks
-    task_queue = Queue()
-    queue_id = id(task_queue)
-
     # ------------------------------------------------------------------ #
     # HEALTH CHECK — must respond immediately for the startup probe
     # ------------------------------------------------------------------ #
@@ -45,60 +59,160 @@ def create_app():
     # ------------------------------------------------------------------ #
     # Queue processing
     # ------------------------------------------------------------------ #
-    def process_queue():
-        while True:
-            job_id, data, task_func, queue_start_time = task_queue.get()
-            queue_time = time.time() - queue_start_time
-            run_start_time = time.time()
-            pid = os.getpid()
-
+    def process_queue(pool, job_id, data, task_func, queue_start_time, cancelled=False):
+        run_start_time = time.time()
+        try:
+            execute_job(pool, job_id, data, task_func, queue_start_time, run_start_time, cancelled)
+        finally:
+            # Even a job that crashed must give back its reservation and journal entry
+            admission.release(job_id)
+            prefetcher.discard(job_id)
+            job_journal.complete(job_id)
+
+    def execute_job(pool, job_id, data, task_func, queue_start_time, run_start_time, cancelled):
+        queue_time = run_start_time - queue_start_time
+        pid = os.getpid()
+
+        if cancelled or job_id in job_journal.cancel_requested([job_id]):
+            # Cancelled while queued: finish it without running the task
+            response = ("Job was cancelled before it started", None, JOB_STOP_CODES["cancelled"])
+            job_status = "cancelled"
+            stats = {}
+        else:
+            job_journal.mark_running(job_id)
             log_job_status(job_id, {
                 "job_status": "running",
                 "job_id": job_id,
                 "queue_id": queue_id,
                 "process_id": pid,
+                "pool": pool,
                 "response": None
             })
 
-            response = task_func()
-            run_time = time.time() - run_start_time
-            total_time = time.time() - queue_start_time
-
-            response_data = {
-                "endpoint": response[1],
-                "code": response[2],
-                "id": data.get("id"),
-                "job_id": job_id,
-                "response": response[0] if response[2] == 200 else None,
-                "message": "success" if response[2] == 200 else response[0],
-                "pid": pid,
-                "queue_id": queue_id,
-                "run_time": round(run_time, 3),
-                "queue_time": round(queue_time, 3),
-                "total_time": round(total_time, 3),
-                "queue_length": task_queue.qsize(),
-                "build_number": BUILD_NUMBER
-            }
-
-            log_job_status(job_id, {
-                "job_status": "done",
-                "job_id": job_id,
-                "queue_id": queue_id,
-                "process_id": pid,
-                "response": response_data
-            })
+            ctx = None
+            try:
+                with job_context(job_id, get_job_timeout(data)) as ctx:
+                    response = task_func()
+            except Exception as e:
+                # The task did not return a response: report it like a failed task
+                logger.error(f"Job {job_id}: task raised {type(e).__name__} - {e}", exc_info=True)
+                response = (f"Internal error: {e}", None, 500)
+            job_status = "done"
+            stats = ctx.stats if ctx else {}
+            if ctx and ctx.reason:
+                response = (f"Job {ctx.reason}", response[1], JOB_STOP_CODES[ctx.reason])
+                job_status = ctx.reason
+
+        run_time = time.time() - run_start_time
+        total_time = time.time() - queue_start_time
+
+        response_data = {
+            "endpoint": response[1],
+            "code": response[2],
+            "id": data.get("id"),
+            "job_id": job_id,
+            "response": response[0] if response[2] == 200 else None,
+            "message": "success" if response[2] == 200 else response[0],
+            "pid": pid,
+            "queue_id": queue_id,
+            "pool": pool,
+            "run_time": round(run_time, 3),
+            "queue_time": round(queue_time, 3),
+            "total_time": round(total_time, 3),
+            "stats": stats,
+            "queue_length": executor.qsize(),
+            "pools": executor.occupancy(),
+            "build_number": BUILD_NUMBER
+        }
+
+        log_job_status(job_id, {
+            "job_status": job_status,
+            "job_id": job_id,
+            "queue_id": queue_id,
+            "process_id": pid,
+            "pool": pool,
+            "response": response_data
+        })
+
+        if data.get("webhook_url") and data.get("webhook_url") != "":
+            send_webhook(data.get("webhook_url"), response_data)
+
+    # Worker pools (cpu / gpu / io) that drain the queued tasks
+    executor = JobExecutor(process_queue)
+    queue_id = id(executor)
 
-            if data.get("webhook_url") and data.get("webhook_url") != "":
-                send_webhook(data.get("webhook_url"), response_data)
-
-            task_queue.task_done()
+    # ------------------------------------------------------------------ #
+    # Admission control
+    # ------------------------------------------------------------------ #
+    def check_admission(job_id, data, estimate):
+        """Reserve resources for a job; returns an error response tuple if it does not fit."""
+        needs = estimate_job_resources(data, estimate, is_gpu_available())
+        rejection = admission.admit(job_id, needs)
+        if not rejection:
+            return None
+        code, message = rejection
+        error_response = {
+            "code": code,
+            "id": data.get("id"),
+            "job_id": job_id,
+            "message": message,
+            "estimate": dict(estimate, **needs),
+            "pid": os.getpid(),
+            "queue_id": queue_id,
+            "queue_length": executor.qsize(),
+            "pools": executor.occupancy(),
+            "build_number": BUILD_NUMBER
+        }
+        log_job_status(job_id, {
+            "job_status": "done",
+            "job_id": job_id,
+            "queue_id": queue_id,
+            "process_id": os.getpid(),
+            "response": error_response
+        })
+        return error_response, code, {"Retry-After": str(ADMISSION_RETRY_AFTER)}
 
-    threading.Thread(target=process_queue, daemon=True).start()
+    # ------------------------------------------------------------------ #
+    # Cancellation
+    # ------------------------------------------------------------------ #
+    def cancel_job(job_id):
+        """Cancel a queued or running job.
+
+        Returns:
+            tuple: (state, http_code) where state is "cancelled" (stopped and
+            its slot freed), "cancelling" (still shutting down) or
+            "cancel_requested" (owned by another worker process).
+        """
+        queued = executor.cancel_queued(job_id, JobCancelled(f"Job {job_id} was cancelled"))
+        if queued:
+            job_pool, item = queued
+            if item is not True:
+                process_queue(job_pool, *item, cancelled=True)
+            logger.info(f"Job {job_id}: cancelled while queued")
+            return "cancelled", 200
+
+        stopped = cancel_running_job(job_id, wait=JOB_KILL_GRACE_SECONDS + 1)
+        if stopped is not None:
+            return ("cancelled", 200) if stopped else ("cancelling", 202)
+
+        record = job_store.get(job_id)
+        if record is None:
+            return "not_found", 404
+        if record.get("job_status") not in ("queued", "running"):
+            return record.get("job_status"), 409
+        # Queued or running in another worker process: its cancel watcher
+        # (or its dequeue) picks the request up from the job journal.
+        if job_journal.request_cancel(job_id):
+            return "cancel_requested", 202
+        return record.get("job_status"), 409
+
+    app.cancel_job = cancel_job
+    app.executor = executor
 
     # ------------------------------------------------------------------ #
     # Queue task decorator
     # ------------------------------------------------------------------ #
-    def queue_task(bypass_queue=False):
+    def queue_task(bypass_queue=False, pool=POOL_CPU):
         def decorator(f):
             def wrapper(*args, **kwargs):
                 data = request.json if request.is_json else {}
@@ -116,7 +230,8 @@ def create_app():
                         "process_id": pid,
                         "response": None
                     })
-                    response = f(job_id=job_id, data=data, *args, **kwargs)
+                    with job_context(job_id, get_job_timeout(data)):
+                        response = f(job_id=job_id, data=data, *args, **kwargs)
                     run_time = time.time() - start_time
                     response_obj = {
                         "endpoint": response[1],
@@ -142,6 +257,8 @@ def create_app():
                     })
                     if data.get("webhook_url") and data.get("webhook_url") != "":
                         send_webhook(data.get("webhook_url"), response_obj)
+                        # The job container exits right after this response: deliver now
+                        webhook_dispatcher.flush()
                     return response_obj, response[2]
 
                 # GCP Cloud Run Job delegation (optional)
@@ -214,15 +331,70 @@ def create_app():
 
                 # Bypass queue or synchronous execution
                 elif bypass_queue or 'webhook_url' not in data:
-                    log_job_status(job_id, {
-                        "job_status": "running",
-                        "job_id": job_id,
-                        "queue_id": queue_id,
-                        "process_id": pid,
-                        "response": None
-                    })
-                    response = f(job_id=job_id, data=data, *args, **kwargs)
-                    run_time = time.time() - start_time
+                    # Synchronous jobs wait for a slot in their executor pool so
+                    # the request thread only blocks this caller, never /health
+                    # or the status endpoints (which bypass the queue).
+                    use_pool = not bypass_queue and SYNC_JOBS_IN_POOL
+                    job_pool = executor.resolve_pool(pool) if use_pool else None
+                    run_start_time = start_time
+
+                    job_status = "done"
+                    stats = {}
+
+                    def run_job():
+                        nonlocal run_start_time, job_status, stats
+                        run_start_time = time.time()
+                        log_job_status(job_id, {
+                            "job_status": "running",
+                            "job_id": job_id,
+                            "queue_id": queue_id,
+                            "process_id": pid,
+                            "pool": job_pool,
+                            "response": None
+                        })
+                        if bypass_queue:
+                            return f(job_id=job_id, data=data, *args, **kwargs)
+                        with job_context(job_id, get_job_timeout(data)) as ctx:
+                            result = f(job_id=job_id, data=data, *args, **kwargs)
+                        stats = ctx.stats
+                        if ctx.reason:
+                            job_status = ctx.reason
+                            return f"Job {ctx.reason}", result[1], JOB_STOP_CODES[ctx.reason]
+                        return result
+
+                    if use_pool:
+                        resolve_stream_inputs(data)
+                        estimate = estimate_job_cost(data)
+                        rejected = check_admission(job_id, data, estimate)
+                        if rejected:
+                            return rejected
+                        log_job_status(job_id, {
+                            "job_status": "queued",
+                            "job_id": job_id,
+                            "queue_id": queue_id,
+                            "process_id": pid,
+                            "pool": job_pool,
+                            "response": None
+                        })
+                        try:
+                            response = executor.run(
+                                job_pool,
+                                run_job,
+                                priority=parse_priority(data.get('priority')),
+                                tenant=get_job_tenant(data, request.headers.get('X-API-Key')),
+                                cost=estimate["cost"],
+                                job_id=job_id
+                            )
+                        except JobCancelled:
+                            job_status = "cancelled"
+                            response = ("Job was cancelled before it started", request.path,
+                                        JOB_STOP_CODES["cancelled"])
+                        finally:
+                            admission.release(job_id)
+                    else:
+                        response = run_job()
+                    run_time = time.time() - run_start_time
+                    total_time = time.time() - start_time
                     response_obj = {
                         "endpoint": response[1],
                         "code": response[2],
@@ -231,25 +403,29 @@ def create_app():
                         "response": response[0] if response[2] == 200 else None,
                         "message": "success" if response[2] == 200 else response[0],
                         "run_time": round(run_time, 3),
-                        "queue_time": 0,
-                        "total_time": round(run_time, 3),
+                        "queue_time": round(total_time - run_time, 3),
+                        "total_time": round(total_time, 3),
+                        "stats": stats,
                         "pid": pid,
                         "queue_id": queue_id,
-                        "queue_length": task_queue.qsize(),
+                        "pool": job_pool,
+                        "queue_length": executor.qsize(),
+                        "pools": executor.occupancy(),
                         "build_number": BUILD_NUMBER
                     }
                     log_job_status(job_id, {
-                        "job_status": "done",
+                        "job_status": job_status,
                         "job_id": job_id,
                         "queue_id": queue_id,
                         "process_id": pid,
+                        "pool": job_pool,
                         "response": response_obj
                     })
                     return response_obj, response[2]
 
                 # Queue the task
                 else:
-                    if MAX_QUEUE_LENGTH > 0 and task_queue.qsize() >= MAX_QUEUE_LENGTH:
+                    if MAX_QUEUE_LENGTH > 0 and executor.qsize() >= MAX_QUEUE_LENGTH:
                         error_response = {
                             "code": 429,
                             "id": data.get("id"),
@@ -257,7 +433,8 @@ def create_app():
                             "message": f"MAX_QUEUE_LENGTH ({MAX_QUEUE_LENGTH}) reached",
                             "pid": pid,
                             "queue_id": queue_id,
-                            "queue_length": task_queue.qsize(),
+                            "queue_length": executor.qsize(),
+                            "pools": executor.occupancy(),
                             "build_number": BUILD_NUMBER
                         }
                         log_job_status(job_id, {
@@ -269,14 +446,34 @@ def create_app():
                         })
                         return error_response, 429
 
+                    job_pool = executor.resolve_pool(pool)
+                    priority = parse_priority(data.pop('priority', 0))
+                    tenant = get_job_tenant(data, request.headers.get('X-API-Key'))
+                    # Stream or download: decided here and journaled with the payload
+                    resolve_stream_inputs(data)
+                    estimate = estimate_job_cost(data)
+                    rejected = check_admission(job_id, data, estimate)
+                    if rejected:
+                        return rejected
                     log_job_status(job_id, {
                         "job_status": "queued",
                         "job_id": job_id,
                         "queue_id": queue_id,
                         "process_id": pid,
+                        "pool": job_pool,
+                        "priority": priority,
+                        "tenant": tenant,
+                        "estimate": estimate,
                         "response": None
                     })
-                    task_queue.put((job_id, data, lambda: f(job_id=job_id, data=data, *args, **kwargs), start_time))
+                    job_journal.enqueue(job_id, request.path, dict(data, priority=priority), job_pool)
+                    executor.submit(
+                        job_pool,
+                        (job_id, data, lambda: f(job_id=job_id, data=data, *args, **kwargs), start_time),
+                        priority=priority,
+                        tenant=tenant,
+                        cost=estimate["cost"]
+                    )
                     return {
                         "code": 202,
                         "id": data.get("id"),
@@ -284,8 +481,12 @@ def create_app():
                         "message": "processing",
                         "pid": pid,
                         "queue_id": queue_id,
+                        "pool": job_pool,
+                        "priority": priority,
+                        "tenant": tenant,
                         "max_queue_length": MAX_QUEUE_LENGTH if MAX_QUEUE_LENGTH > 0 else "unlimited",
-                        "queue_length": task_queue.qsize(),
+                        "queue_length": executor.qsize(),
+                        "pools": executor.occupancy(),
                         "build_number": BUILD_NUMBER
                     }, 202
             return wrapper
@@ -293,6 +494,105 @@ def create_app():
 
     app.queue_task = queue_task
 
+    # ------------------------------------------------------------------ #
+    # Background services — started once per (forked) worker process
+    # ------------------------------------------------------------------ #
+    started_pid = None
+
+    def fail_replay(job, message, code=500):
+        """Finish a journaled job that will not run again and tell its caller."""
+        job_id = job["job_id"]
+        payload = job["payload"]
+        error_response = {
+            "endpoint": job["path"],
+            "code": code,
+            "id": payload.get("id"),
+            "job_id": job_id,
+            "response": None,
+            "message": message,
+            "pid": os.getpid(),
+            "queue_id": queue_id,
+            "build_number": BUILD_NUMBER
+        }
+        log_job_status(job_id, {
+            "job_status": "failed",
+            "job_id": job_id,
+            "queue_id": queue_id,
+            "process_id": os.getpid(),
+            "response": error_response
+        })
+        if payload.get("webhook_url"):
+            send_webhook(payload["webhook_url"], error_response)
+        job_journal.complete(job_id)
+
+    def replay_job(job, retry_until):
+        """Re-submit a journaled job through its original endpoint.
+
+        Returns:
+            bool: True if the job was turned away for now (429/503) and
+            should be replayed again later
+        """
+        job_id = job["job_id"]
+        payload = job["payload"]
+
+        if job["attempts"] >= JOB_JOURNAL_MAX_ATTEMPTS:
+            logger.error(f"Job {job_id}: dropped after {job['attempts']} interrupted attempts")
+            fail_replay(job, f"Job was interrupted {job['attempts']} times and will not be retried")
+            return False
+
+        logger.info(f"Job {job_id}: replaying {job['path']} from the job journal")
+        replay_payload = dict(payload, _cloud_job_id=job_id)
+        try:
+            endpoint, view_args = app.url_map.bind('localhost').match(job["path"], method='POST')
+            with app.test_request_context(job["path"], method='POST', json=replay_payload,
+                                          headers={'X-API-Key': API_KEY or ''}):
+                result = app.view_functions[endpoint](**view_args)
+        except Exception as e:
+            logger.error(f"Job {job_id}: replay failed - {e}")
+            fail_replay(job, f"Job could not be resumed after a restart: {e}")
+            return False
+        code = result[1] if isinstance(result, tuple) else 200
+        if code == 202:
+            return False
+        if code in (429, 503) and time.time() < retry_until:
+            # Queue full or resources short: the entry stays in the journal
+            logger.info(f"Job {job_id}: replay returned {code}, retrying in {ADMISSION_RETRY_AFTER}s")
+            return True
+        logger.warning(f"Job {job_id}: replay returned {code}, giving up")
+        body = result[0] if isinstance(result, tuple) else result
+        message = body.get("message") if isinstance(body, dict) else None
+        fail_replay(job, message or f"Job could not be resumed after a restart (HTTP {code})", code)
+        return False
+
+    def replay_jobs(jobs):
+        retry_until = time.time() + JOB_JOURNAL_REPLAY_RETRY_SECONDS
+        while jobs:
+            jobs = [job for job in jobs if replay_job(job, retry_until)]
+            if jobs:
+                time.sleep(ADMISSION_RETRY_AFTER)
+
+    def start_background_services():
+        nonlocal started_pid
+        if started_pid == os.getpid():
+            return
+        started_pid = os.getpid()
+        executor.start()
+        job_store.start_compactor()
+        webhook_dispatcher.start()
+        start_cancel_watcher(job_journal.cancel_requested)
+        sweep_scratch_orphans()
+        prefetcher.start(executor.peek, get_prefetch_urls)
+        storage_clients.warm()
+        orphans = job_journal.claim_orphans()
+        if orphans:
+            threading.Thread(target=replay_jobs, args=(orphans,), name="job-replay", daemon=True).start()
+
+    @app.before_request
+    def ensure_background_services():
+        start_background_services()
+
+    app.start_background_services = start_background_services
+
     # ------------------------------------------------------------------ #
     # EXPLICIT BLUEPRINT REGISTRATION — Only the lean endpoints
     # ------------------------------------------------------------------ #
@@ -308,7 +608,7 @@ def create_app():
     app.register_blueprint(v1_code_execute_bp)
     logger.info("  ✅ /v1/code/execute/python")
 
-    # Toolkit: Test, Auth, Job Status
+    # Toolkit: Test, Auth, Job Status, Job Cancel, Metrics
     from routes.v1.toolkit.test import v1_toolkit_test_bp
     app.register_blueprint(v1_toolkit_test_bp)
     logger.info("  ✅ /v1/toolkit/test")
@@ -325,6 +625,14 @@ def create_app():
     app.register_blueprint(v1_toolkit_jobs_status_bp)
     logger.info("  ✅ /v1/toolkit/jobs/status")
 
+    from routes.v1.toolkit.job_cancel import v1_toolkit_job_cancel_bp
+    app.register_blueprint(v1_toolkit_job_cancel_bp)
+    logger.info("  ✅ /v1/toolkit/job/cancel")
+
+    from routes.v1.toolkit.metrics import v1_toolkit_metrics_bp
+    app.register_blueprint(v1_toolkit_metrics_bp)
+    logger.info("  ✅ /v1/toolkit/metrics")
+
     # Storage: S3 & GCP upload
     from routes.v1.s3.upload import v1_s3_upload_bp
     app.register_blueprint(v1_s3_upload_bp)
@@ -334,7 +642,7 @@ def create_app():
     app.register_blueprint(v1_gcp_upload_bp)
     logger.info("  ✅ /v1/gcp/upload")
 
-    logger.info(f"✅ Registered 8 lean blueprints (build {BUILD_NUMBER})")
+    logger.info(f"✅ Registered 10 lean blueprints (build {BUILD_NUMBER})")
 
     return app
 
@@ -7,6 +7,8 @@ import os
 import json
 import time
 from config import LOCAL_STORAGE_PATH
+from services.job_store import job_store
+from services.job_executor import POOL_CPU
 
 def validate_payload(schema):
     def decorator(f):
@@ -19,6 +21,8 @@ def validate_payload(schema):
             validation_data = request.json.copy()
             validation_data.pop('_cloud_job_id', None)
             validation_data.pop('disable_cloud_job', None)
+            validation_data.pop('priority', None)
+            validation_data.pop('job_timeout', None)
 
             try:
                 jsonschema.validate(instance=validation_data, schema=schema)
@@ -30,17 +34,12 @@ def validate_payload(schema):
     return decorator
 
 def log_job_status(job_id, data):
-    """Log job status to a file in the STORAGE_PATH/jobs folder."""
-    jobs_dir = os.path.join(LOCAL_STORAGE_PATH, 'jobs')
-    if not os.path.exists(jobs_dir):
-        os.makedirs(jobs_dir, exist_ok=True)
-    job_file = os.path.join(jobs_dir, f"{job_id}.json")
-    with open(job_file, 'w') as f:
-        json.dump(data, f, indent=2)
+    """Record the job status in the job store (STORAGE_PATH/jobs/status.db)."""
+    job_store.put(job_id, data)
 
-def queue_task_wrapper(bypass_queue=False):
+def queue_task_wrapper(bypass_queue=False, pool=POOL_CPU):
     def decorator(f):
         def wrapper(*args, **kwargs):
-            return current_app.queue_task(bypass_queue=bypass_queue)(f)(*args, **kwargs)
+            return current_app.queue_task(bypass_queue=bypass_queue, pool=pool)(f)(*args, **kwargs)
         return wrapper
     return decorator
\ No newline at end of file
@@ -8,7 +8,11 @@ bind = "[::]:8080"  # Dual-stack: listens on BOTH IPv6 and IPv4 (required for Sa
 workers = int(os.environ.get("GUNICORN_WORKERS", 1))
 timeout = int(os.environ.get("GUNICORN_TIMEOUT", 3600))
 keepalive = 80
-worker_class = "sync"
+# Threaded workers: synchronous jobs block only their own request thread (the
+# work itself runs on the job executor pools), so /health and the status
+# endpoints keep answering while long renders are in flight.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
 
 # Faster startup: preload the app so workers fork from a ready parent
 preload_app = True
@@ -19,6 +23,17 @@ def on_starting(server):
     print("🚀 NCA-GPU-LEAN starting up...")
 
 
+def post_worker_init(worker):
+    """Hook called in each worker once the app is loaded.
+
+    Threads started in the preloaded parent do not survive fork(), so the job
+    executor is started here and unfinished journaled jobs are replayed.
+    """
+    start = getattr(worker.wsgi, "start_background_services", None)
+    if start:
+        start()
+
+
 def when_ready(server):
     """Hook called when Gunicorn server is ready to accept connections."""
     print("✅ NCA-GPU-LEAN is READY and accepting connections on port 8080")
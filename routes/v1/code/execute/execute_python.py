@@ -21,6 +21,7 @@ import logging
 from flask import Blueprint, request
 from services.authentication import authenticate
 from app_utils import validate_payload, queue_task_wrapper
+from services.job_control import run_process
 import subprocess
 import tempfile
 import json
@@ -95,12 +96,7 @@ print(json.dumps(result))
             logger.debug(f"Generated code:\n{final_code}")
             
             try:
-                result = subprocess.run(
-                    ['python3', temp_file.name],
-                    capture_output=True,
-                    text=True,
-                    timeout=timeout
-                )
+                result = run_process(['python3', temp_file.name], timeout=timeout)
                 
                 try:
                     output = json.loads(result.stdout)
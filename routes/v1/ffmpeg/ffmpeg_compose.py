@@ -20,9 +20,10 @@ import os
 import logging
 from flask import Blueprint, request, jsonify
 from app_utils import *
+from services.job_executor import POOL_GPU
 from services.v1.ffmpeg.ffmpeg_compose import process_ffmpeg_compose
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.cloud_storage import upload_files
 
 v1_ffmpeg_compose_bp = Blueprint('v1_ffmpeg_compose', __name__)
 logger = logging.getLogger(__name__)
@@ -38,6 +39,7 @@ logger = logging.getLogger(__name__)
                 "type": "object",
                 "properties": {
                     "file_url": {"type": "string", "format": "uri"},
+                    "stream": {"type": "boolean"},
                     "options": {
                         "type": "array",
                         "items": {
@@ -79,7 +81,8 @@ logger = logging.getLogger(__name__)
                             },
                             "required": ["option"]
                         }
-                    }
+                    },
+                    "stream_upload": {"type": "boolean"}
                 },
                 "required": ["options"]
             },
@@ -107,40 +110,49 @@ logger = logging.getLogger(__name__)
             }
         },
         "webhook_url": {"type": "string", "format": "uri"},
+        "progress_webhook_url": {"type": "string", "format": "uri"},
         "id": {"type": "string"}
     },
     "required": ["inputs", "outputs"],
     "additionalProperties": False
 })
-@queue_task_wrapper(bypass_queue=False)
+@queue_task_wrapper(bypass_queue=False, pool=POOL_GPU)
 def ffmpeg_api(job_id, data):
     logger.info(f"Job {job_id}: Received flexible FFmpeg request")
 
     try:
-        output_filenames, metadata = process_ffmpeg_compose(data, job_id)
+        output_filenames, metadata, uploaded_urls = process_ffmpeg_compose(data, job_id)
         
-        # Upload output files to GCP and create result array
+        for output_filename in output_filenames:
+            if not os.path.exists(output_filename):
+                raise Exception(f"Expected output file {output_filename} not found")
+
+        # Upload every output (unless uploaded while encoding) and thumbnail concurrently
+        pending = [i for i in range(len(output_filenames)) if i not in uploaded_urls]
+        thumbnails = {}
+        for i, output_metadata in enumerate((metadata or [])[:len(output_filenames)]):
+            thumbnail_path = output_metadata.get('thumbnail')
+            if thumbnail_path and os.path.exists(thumbnail_path):
+                thumbnails[i] = thumbnail_path
+        upload_urls = upload_files([output_filenames[i] for i in pending] + list(thumbnails.values()))
+        file_urls = {**uploaded_urls, **dict(zip(pending, upload_urls))}
+        thumbnail_urls = dict(zip(thumbnails, upload_urls[len(pending):]))
+
+        # Create result array in output order
         output_urls = []
         for i, output_filename in enumerate(output_filenames):
-            if os.path.exists(output_filename):
-                upload_url = upload_file(output_filename)
-                output_info = {"file_url": upload_url}
-                
-                if metadata and i < len(metadata):
-                    output_metadata = metadata[i]
-                    if 'thumbnail' in output_metadata:
-                        thumbnail_path = output_metadata['thumbnail']
-                        if os.path.exists(thumbnail_path):
-                            thumbnail_url = upload_file(thumbnail_path)
-                            del output_metadata['thumbnail']
-                            output_metadata['thumbnail_url'] = thumbnail_url
-                            os.remove(thumbnail_path)  # Clean up local thumbnail file
-                    output_info.update(output_metadata)
-                
-                output_urls.append(output_info)
-                os.remove(output_filename)  # Clean up local output file after upload
-            else:
-                raise Exception(f"Expected output file {output_filename} not found")
+            output_info = {"file_url": file_urls[i]}
+            
+            if metadata and i < len(metadata):
+                output_metadata = metadata[i]
+                if i in thumbnail_urls:
+                    del output_metadata['thumbnail']
+                    output_metadata['thumbnail_url'] = thumbnail_urls[i]
+                    os.remove(thumbnails[i])  # Clean up local thumbnail file
+                output_info.update(output_metadata)
+            
+            output_urls.append(output_info)
+            os.remove(output_filename)  # Clean up local output file after upload
 
         return output_urls, "/v1/ffmpeg/compose", 200
         
@@ -17,6 +17,7 @@
 from flask import Blueprint, request, jsonify
 from services.authentication import authenticate
 from app_utils import validate_payload, queue_task_wrapper
+from services.job_executor import POOL_IO
 from services.v1.gcp.upload import stream_upload_to_gcs
 import os
 import json
@@ -40,7 +41,7 @@ v1_gcp_upload_bp = Blueprint('v1_gcp_upload', __name__)
     "required": ["file_url"],
     "additionalProperties": False
 })
-@queue_task_wrapper(bypass_queue=False)
+@queue_task_wrapper(bypass_queue=False, pool=POOL_IO)
 def gcp_upload_endpoint(job_id, data):
     try:
         filename = data.get('filename')  # Optional, will default to original filename if not provided
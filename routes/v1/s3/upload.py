@@ -19,6 +19,7 @@
 from flask import Blueprint, request, jsonify
 from services.authentication import authenticate
 from app_utils import validate_payload, queue_task_wrapper
+from services.job_executor import POOL_IO
 from services.v1.s3.upload import stream_upload_to_s3
 import os
 import json
@@ -42,7 +43,7 @@ v1_s3_upload_bp = Blueprint('v1_s3_upload', __name__)
     "required": ["file_url"],
     "additionalProperties": False
 })
-@queue_task_wrapper(bypass_queue=False)
+@queue_task_wrapper(bypass_queue=False, pool=POOL_IO)
 def s3_upload_endpoint(job_id, data):
     try:
         file_url = data.get('file_url')
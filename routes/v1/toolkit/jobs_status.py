@@ -16,13 +16,11 @@
 
 
 
-import os
-import json
 import logging
 import time
 from flask import Blueprint, request
-from config import LOCAL_STORAGE_PATH
 from services.authentication import authenticate
+from services.job_store import job_store
 from app_utils import queue_task_wrapper, validate_payload
 
 v1_toolkit_jobs_status_bp = Blueprint('v1_toolkit_jobs_status', __name__)
@@ -34,56 +32,49 @@ logger = logging.getLogger(__name__)
 def get_all_jobs_status(job_id, data):
     """
     Get the status of all jobs within a specified time range
-    
+
     Args:
         job_id (str): Job ID assigned by queue_task_wrapper (unused)
-        data (dict): Request data containing optional since_seconds parameter
-    
+        data (dict): Request data with optional parameters:
+            since_seconds (number): Only jobs updated in this window (default 600)
+            status (str or list): Only jobs in these statuses (e.g. "queued")
+            limit (int): Page size; enables pagination
+            cursor (str): ``next_cursor`` returned by the previous page
+
     Returns:
-        Tuple of (jobs_status_data, endpoint_string, status_code)
+        Tuple of (jobs_status_data, endpoint_string, status_code). Without
+        ``limit``/``cursor`` the data is a ``{job_id: job_status}`` mapping;
+        with pagination it is ``{"jobs": {...}, "next_cursor": ...}``.
     """
     logger.info("Retrieving status for all jobs")
     endpoint = "/v1/toolkit/jobs/status"
-    
+
     try:
+        data = data or {}
+
         # Get time range parameter (default to 600 seconds/10 minutes if not provided)
-        since_seconds = 600
-        if data and "since_seconds" in data:
-            since_seconds = data.get("since_seconds")
-            
-        cutoff_time = time.time() - since_seconds
-        
-        # Construct the path to the jobs directory
-        jobs_dir = os.path.join(LOCAL_STORAGE_PATH, 'jobs')
-        
-        # Check if the jobs directory exists
-        if not os.path.exists(jobs_dir):
-            return {"error": "Jobs directory not found"}, endpoint, 404
-        
-        # Dictionary to store job statuses
+        since_seconds = data.get("since_seconds", 600)
+        cutoff_time = time.time() - float(since_seconds)
+
+        statuses = data.get("status")
+        if isinstance(statuses, str):
+            statuses = [statuses]
+
+        limit = data.get("limit")
+        cursor = data.get("cursor")
+        if limit is not None and (not isinstance(limit, int) or limit < 1):
+            return {"error": "limit must be a positive integer"}, endpoint, 400
+
+        rows, next_cursor = job_store.list(since=cutoff_time, statuses=statuses, limit=limit, cursor=cursor)
         jobs_status = {}
-        
-        # Iterate through job files in the directory
-        for filename in os.listdir(jobs_dir):
-            if filename.endswith('.json'):
-                job_file_path = os.path.join(jobs_dir, filename)
-                file_mod_time = os.path.getmtime(job_file_path)
-                
-                # Check if the file was modified within the time range
-                if file_mod_time >= cutoff_time:
-                    job_id = filename.split('.')[0]  # Remove .json extension to get job_id
-                    
-                    # Read the job status file
-                    with open(job_file_path, 'r') as file:
-                        job_data = json.load(file)
-                        
-                        # Only include the job_status field, not the response
-                        if "job_status" in job_data:
-                            jobs_status[job_id] = job_data["job_status"]
-        
-        # Return the job statuses
-        return jobs_status, endpoint, 200
-        
+        for row_job_id, status, _ in rows:
+            # Newest record wins if a job also has an older archived entry
+            jobs_status.setdefault(row_job_id, status)
+
+        if limit is None and cursor is None:
+            return jobs_status, endpoint, 200
+        return {"jobs": jobs_status, "next_cursor": next_cursor}, endpoint, 200
+
     except Exception as e:
         logger.error(f"Error retrieving status for jobs: {str(e)}")
-        return {"error": f"Failed to retrieve job statuses: {str(e)}"}, endpoint, 500 
\ No newline at end of file
+        return {"error": f"Failed to retrieve job statuses: {str(e)}"}, endpoint, 500
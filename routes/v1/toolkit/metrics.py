@@ -0,0 +1,59 @@
+# Copyright (c) 2025 Stephen G. Pope
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+import logging
+from flask import Blueprint, current_app
+from services.authentication import authenticate
+from services.job_store import job_store
+from services.admission import admission
+from services.webhook import webhook_dispatcher
+from services.media_cache import media_cache
+from services.http_client import http_client
+from services.scratch import scratch_stats
+from services.bandwidth import bandwidth
+from services.prefetch import prefetcher
+from services.storage_clients import storage_clients
+from services.upload_dedup import upload_index
+from app_utils import queue_task_wrapper
+
+v1_toolkit_metrics_bp = Blueprint('v1_toolkit_metrics', __name__)
+logger = logging.getLogger(__name__)
+
+@v1_toolkit_metrics_bp.route('/v1/toolkit/metrics', methods=['GET'])
+@authenticate
+@queue_task_wrapper(bypass_queue=True)
+def get_metrics(job_id, data):
+    """Report sizes and counters of the toolkit's internal stores."""
+    endpoint = "/v1/toolkit/metrics"
+    try:
+        return {
+            "pools": current_app.executor.occupancy(tenants=True),
+            "job_store": job_store.stats(),
+            "admission": admission.stats(),
+            "webhooks": webhook_dispatcher.stats(),
+            "media_cache": media_cache.stats(),
+            "http": http_client.stats(),
+            "scratch": scratch_stats(),
+            "bandwidth": bandwidth.stats(),
+            "prefetch": prefetcher.stats(),
+            "storage": storage_clients.stats(),
+            "upload_dedup": upload_index.stats()
+        }, endpoint, 200
+    except Exception as e:
+        logger.error(f"Error collecting metrics: {str(e)}")
+        return {"error": f"Failed to collect metrics: {str(e)}"}, endpoint, 500
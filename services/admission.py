@@ -0,0 +1,177 @@
+# NCA-GPU-LEAN — Admission control
+#
+# Before a job is accepted, its disk, RAM and NVENC session needs are
+# estimated from the payload (and the HEAD/ffprobe estimate of its inputs)
+# and checked against live psutil numbers:
+#   - 503: the host itself is short (free disk / available RAM below what
+#          the job needs, or more NVENC sessions than the GPU can open)
+#   - 429: the host could fit the job, but not on top of the disk already
+#          reserved by admitted jobs that have not finished yet
+# Both responses carry a Retry-After header.
+
+import os
+import logging
+import threading
+import psutil
+from config import LOCAL_STORAGE_PATH
+from services.v1.ffmpeg.ffmpeg_compose import get_fetch_plan
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', 'true').lower() in ['true', '1']
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 30))
+ADMISSION_DISK_HEADROOM = int(os.environ.get('ADMISSION_DISK_HEADROOM_BYTES', 1024 ** 3))
+ADMISSION_RAM_HEADROOM = int(os.environ.get('ADMISSION_RAM_HEADROOM_BYTES', 512 * 1024 ** 2))
+# Inputs are downloaded and outputs written locally: budget this many times the input size
+ADMISSION_DISK_FACTOR = float(os.environ.get('ADMISSION_DISK_FACTOR', 2.0))
+# Baseline resident memory of one ffmpeg job, plus frame buffers per output pixel
+ADMISSION_JOB_RAM_BYTES = int(os.environ.get('ADMISSION_JOB_RAM_BYTES', 256 * 1024 ** 2))
+FRAME_BUFFER_FRAMES = 64
+NVENC_MAX_SESSIONS = int(os.environ.get('NVENC_MAX_SESSIONS', 5))
+
+UHD_PIXELS = 3840 * 2160
+HD_PIXELS = 1920 * 1080
+NVENC_CONTAINERS = ['mp4', 'mkv', 'mov']
+
+
+def _output_options(output):
+    return {opt.get("option"): opt.get("argument") for opt in output.get("options", [])}
+
+
+def estimate_output_pixels(output):
+    """Best-effort output frame size from -s / scale= options (defaults to 1080p)."""
+    options = _output_options(output)
+    size = str(options.get("-s") or "")
+    if "x" in size:
+        try:
+            width, height = size.lower().split("x", 1)
+            return int(width) * int(height)
+        except ValueError:
+            pass
+    text = " ".join(str(v) for v in options.values())
+    if any(token in text for token in ("3840", "2160", "4k", "uhd")):
+        return UHD_PIXELS
+    return HD_PIXELS
+
+
+def estimate_nvenc_sessions(data, gpu_available):
+    """Number of NVENC encoder sessions a compose payload will open."""
+    sessions = 0
+    for output in data.get("outputs", []) or []:
+        options = _output_options(output)
+        codec = str(options.get("-c:v") or options.get("-vcodec") or "")
+        if "nvenc" in codec:
+            sessions += 1
+        elif not codec and gpu_available:
+            # process_ffmpeg_compose picks h264_nvenc for these containers
+            container = str(options.get("-f") or "mp4").lower()
+            if container in NVENC_CONTAINERS:
+                sessions += 1
+    return sessions
+
+
+def estimate_downloaded_bytes(data, estimate):
+    """Bytes of input a compose job writes to local disk.
+
+    Inputs that ffmpeg streams over HTTP (see get_fetch_plan) never touch
+    the disk and are left out.
+    """
+    sizes = estimate.get("input_sizes")
+    if not sizes:
+        return estimate.get("input_bytes") or 0
+    try:
+        streamed = get_fetch_plan(data)[0]
+    except (KeyError, TypeError):
+        streamed = set()  # malformed payload: rejected by validation anyway
+    return sum(size for url, size in sizes.items() if url not in streamed)
+
+
+def estimate_job_resources(data, estimate, gpu_available):
+    """Estimate the disk, RAM and NVENC needs of a job payload.
+
+    Args:
+        data (dict): Job payload
+        estimate (dict): Output of services.job_cost.estimate_job_cost
+
+    Returns:
+        dict: ``disk_bytes``, ``ram_bytes`` and ``nvenc_sessions``
+    """
+    outputs = data.get("outputs", []) or []
+    # Only compose jobs materialize inputs locally (minus the ones ffmpeg streams); uploads stream through
+    disk_bytes = int(estimate_downloaded_bytes(data, estimate) * ADMISSION_DISK_FACTOR) if "inputs" in data else 0
+    ram_bytes = 0
+    if outputs:
+        ram_bytes = ADMISSION_JOB_RAM_BYTES + sum(
+            int(estimate_output_pixels(output) * 1.5 * FRAME_BUFFER_FRAMES) for output in outputs
+        )
+    return {
+        "disk_bytes": disk_bytes,
+        "ram_bytes": ram_bytes,
+        "nvenc_sessions": estimate_nvenc_sessions(data, gpu_available)
+    }
+
+
+class AdmissionController:
+    """Tracks disk reserved by admitted jobs and rejects jobs that do not fit."""
+
+    def __init__(self, storage_path=LOCAL_STORAGE_PATH):
+        self.storage_path = storage_path
+        self._lock = threading.Lock()
+        self._reserved = {}  # job_id -> resources
+        self.rejected = {"429": 0, "503": 0}
+
+    def reserved_disk(self):
+        return sum(r["disk_bytes"] for r in self._reserved.values())
+
+    def admit(self, job_id, needs):
+        """Reserve ``needs`` for a job.
+
+        Returns:
+            None if admitted, otherwise (status_code, message).
+        """
+        if not ADMISSION_CONTROL:
+            return None
+
+        os.makedirs(self.storage_path, exist_ok=True)
+        free_disk = psutil.disk_usage(self.storage_path).free - ADMISSION_DISK_HEADROOM
+        available_ram = psutil.virtual_memory().available - ADMISSION_RAM_HEADROOM
+
+        with self._lock:
+            rejection = None
+            if needs["nvenc_sessions"] > NVENC_MAX_SESSIONS:
+                rejection = (503, f"Job needs {needs['nvenc_sessions']} NVENC sessions, "
+                                  f"the GPU allows {NVENC_MAX_SESSIONS}")
+            elif needs["disk_bytes"] > free_disk:
+                rejection = (503, f"Insufficient disk space: job needs ~{needs['disk_bytes']} bytes, "
+                                  f"{max(free_disk, 0)} available")
+            elif needs["ram_bytes"] > available_ram:
+                rejection = (503, f"Insufficient memory: job needs ~{needs['ram_bytes']} bytes, "
+                                  f"{max(available_ram, 0)} available")
+            elif needs["disk_bytes"] > free_disk - self.reserved_disk():
+                rejection = (429, f"Disk space is reserved by queued jobs: job needs ~{needs['disk_bytes']} bytes, "
+                                  f"{max(free_disk - self.reserved_disk(), 0)} unreserved")
+
+            if rejection:
+                self.rejected[str(rejection[0])] += 1
+                logger.warning(f"Job {job_id}: rejected by admission control - {rejection[1]}")
+                return rejection
+
+            self._reserved[job_id] = needs
+            return None
+
+    def release(self, job_id):
+        """Release the reservation of a finished job."""
+        with self._lock:
+            self._reserved.pop(job_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": ADMISSION_CONTROL,
+                "admitted_jobs": len(self._reserved),
+                "reserved_disk_bytes": self.reserved_disk(),
+                "rejected": dict(self.rejected)
+            }
+
+
+admission = AdmissionController()
@@ -9,9 +9,9 @@ import srt
 import re
 from services.file_management import download_file
 from services.cloud_storage import upload_file
-import requests
+from services.http_client import http_client
 from urllib.parse import urlparse
-from config import LOCAL_STORAGE_PATH
+from services.scratch import job_scratch_path
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -99,7 +99,7 @@ def is_url(string):
     except: return False
 
 def download_captions(captions_url):
-    response = requests.get(captions_url)
+    response = http_client.get(captions_url)
     response.raise_for_status()
     return response.text
 
@@ -169,8 +169,9 @@ def generate_ass_captions_v1(video_url, captions, settings, replace, exclude_tim
     header = generate_ass_header(style_options, resolution)
     body = handle_classic(trans_res, style_options, replace_dict, resolution)
     
-    ass_path = os.path.join(LOCAL_STORAGE_PATH, f"{job_id}.ass")
-    with open(ass_path, 'w') as f:
-        f.write(header + body)
+    content = (header + body).encode('utf-8')
+    ass_path = job_scratch_path(f"{job_id}.ass", len(content))
+    with open(ass_path, 'wb') as f:
+        f.write(content)
     
     return ass_path
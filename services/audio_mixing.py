@@ -19,8 +19,8 @@
 import os
 import subprocess
 from services.file_management import download_file
-
-STORAGE_PATH = "/tmp/"
+from services.scratch import job_scratch_dir
+from services.job_control import run_process
 
 def get_duration(file_path):
     cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', file_path]
@@ -28,9 +28,10 @@ def get_duration(file_path):
     return float(result.stdout)
 
 def process_audio_mixing(video_url, audio_url, video_vol, audio_vol, output_length, job_id, webhook_url=None):
-    video_path = download_file(video_url, STORAGE_PATH)
-    audio_path = download_file(audio_url, STORAGE_PATH)
-    output_path = os.path.join(STORAGE_PATH, f"{job_id}.mp4")
+    work_dir = job_scratch_dir()  # removed with everything in it when the job ends
+    video_path = download_file(video_url, work_dir)
+    audio_path = download_file(audio_url, work_dir)
+    output_path = os.path.join(work_dir, f"{job_id}.mp4")
 
     video_duration = get_duration(video_path)
     audio_duration = get_duration(audio_path)
@@ -75,7 +76,7 @@ def process_audio_mixing(video_url, audio_url, video_vol, audio_vol, output_leng
     cmd.append(output_path)
 
     # Run FFmpeg command
-    subprocess.run(cmd, check=True)
+    run_process(cmd, check=True)
 
     # Clean up input files
     os.remove(video_path)
@@ -0,0 +1,181 @@
+# NCA-GPU-LEAN — Download bandwidth and connection scheduler
+#
+# Every body transfer (input downloads, range segments, the source side of
+# stream_upload_to_s3) runs as a "flow" obtained from bandwidth.transfer().
+#
+#   - Connections: a flow waits for a slot until the worker is below
+#     BANDWIDTH_MAX_CONNECTIONS, its host below BANDWIDTH_HOST_CONNECTIONS and
+#     its job below BANDWIDTH_JOB_CONNECTIONS. Waiting small transfers
+#     (declared size up to BANDWIDTH_SMALL_BYTES) get free slots before bulk
+#     ones; otherwise slots are handed out first come, first served.
+#   - Bandwidth: with BANDWIDTH_LIMIT_MBPS set, chunks are paced by a token
+#     bucket and served in start-time fair queuing order. A flow's weight is
+#     BANDWIDTH_SMALL_WEIGHT for small transfers and 1 for bulk ones, divided
+#     by the number of flows its job has open, so jobs (not connections)
+#     share the link and small fetches overtake a running multi-GB fetch.
+#     Set the limit slightly below the link capacity so the queue forms here
+#     rather than in the network. Without a limit only connections are
+#     scheduled.
+#
+# Limits apply per worker process.
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from services.job_control import current_job, raise_if_cancelled
+import os
+
+logger = logging.getLogger(__name__)
+
+BANDWIDTH_LIMIT_MBPS = float(os.environ.get('BANDWIDTH_LIMIT_MBPS', 0))
+BANDWIDTH_MAX_CONNECTIONS = int(os.environ.get('BANDWIDTH_MAX_CONNECTIONS', 32))
+BANDWIDTH_HOST_CONNECTIONS = int(os.environ.get('BANDWIDTH_HOST_CONNECTIONS', 8))
+BANDWIDTH_JOB_CONNECTIONS = int(os.environ.get('BANDWIDTH_JOB_CONNECTIONS', 8))
+BANDWIDTH_SMALL_BYTES = int(os.environ.get('BANDWIDTH_SMALL_BYTES', 64 * 1024 ** 2))
+BANDWIDTH_SMALL_WEIGHT = float(os.environ.get('BANDWIDTH_SMALL_WEIGHT', 8))
+BURST_SECONDS = 0.25  # tokens that may accumulate while the link is idle
+WAIT_POLL_SECONDS = 1.0  # re-check cancellation while waiting
+
+
+class Flow:
+    """One scheduled connection; call consume() for every chunk received."""
+
+    def __init__(self, scheduler, url, size, job_id):
+        self.scheduler = scheduler
+        self.host = urlparse(url).netloc
+        self.size = size
+        self.job_id = job_id
+        self.small = bool(size) and size <= BANDWIDTH_SMALL_BYTES
+        self.finish_tag = 0.0
+        self.start_tag = None
+        self.bytes = 0
+
+    def consume(self, nbytes):
+        self.scheduler._consume(self, nbytes)
+
+
+class BandwidthScheduler:
+    def __init__(self, limit_mbps=BANDWIDTH_LIMIT_MBPS):
+        self.rate = limit_mbps * 125000  # bytes per second
+        self._cond = threading.Condition()
+        self._active = []
+        self._waiting = []
+        self._pending = []  # flows with a chunk waiting for tokens
+        self._tokens = 0.0
+        self._refilled_at = time.monotonic()
+        self._vclock = 0.0
+        self.counters = {
+            "transfers": 0,
+            "small_transfers": 0,
+            "bytes": 0,
+            "slot_wait_seconds": 0.0,
+            "throttle_seconds": 0.0
+        }
+
+    def _count(self, flow, key):
+        return sum(1 for other in self._active if getattr(other, key) == getattr(flow, key))
+
+    def _has_room(self, flow):
+        if len(self._active) >= BANDWIDTH_MAX_CONNECTIONS:
+            return False
+        if self._count(flow, "host") >= BANDWIDTH_HOST_CONNECTIONS:
+            return False
+        return flow.job_id is None or self._count(flow, "job_id") < BANDWIDTH_JOB_CONNECTIONS
+
+    def _next_eligible(self):
+        """The waiting flow to admit next: small before bulk, then arrival order."""
+        for flow in sorted(self._waiting, key=lambda f: not f.small):  # sort is stable
+            if self._has_room(flow):
+                return flow
+        return None
+
+    @contextmanager
+    def transfer(self, url, size=None):
+        """Hold a connection slot for a transfer of ``size`` bytes (None if unknown).
+
+        Raises:
+            JobCancelled / JobTimeout: if the job is stopped while waiting
+        """
+        ctx = current_job()
+        flow = Flow(self, url, size, ctx.job_id if ctx else None)
+        start = time.monotonic()
+        with self._cond:
+            self._waiting.append(flow)
+            try:
+                while self._next_eligible() is not flow:
+                    self._cond.wait(WAIT_POLL_SECONDS)
+                    raise_if_cancelled()
+            finally:
+                self._waiting.remove(flow)
+                self._cond.notify_all()
+            self._active.append(flow)
+            self.counters["transfers"] += 1
+            self.counters["small_transfers"] += flow.small
+            self.counters["slot_wait_seconds"] += time.monotonic() - start
+        try:
+            yield flow
+        finally:
+            with self._cond:
+                self._active.remove(flow)
+                self.counters["bytes"] += flow.bytes
+                self._cond.notify_all()
+
+    def _weight(self, flow):
+        same_job = self._count(flow, "job_id") if flow.job_id is not None else 1
+        return (BANDWIDTH_SMALL_WEIGHT if flow.small else 1.0) / max(same_job, 1)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._refilled_at) * self.rate, self.rate * BURST_SECONDS)
+        self._refilled_at = now
+
+    def _consume(self, flow, nbytes):
+        flow.bytes += nbytes
+        if not self.rate:
+            return
+        start = time.monotonic()
+        with self._cond:
+            flow.start_tag = max(self._vclock, flow.finish_tag)
+            flow.finish_tag = flow.start_tag + nbytes / self._weight(flow)
+            self._pending.append(flow)
+            try:
+                while True:
+                    self._refill()
+                    head = min(self._pending, key=lambda f: f.start_tag)
+                    if head is flow and self._tokens > 0:
+                        # May go negative: a chunk larger than the burst is paid for afterwards
+                        self._tokens -= nbytes
+                        self._vclock = flow.start_tag
+                        break
+                    if head is flow:
+                        timeout = -self._tokens / self.rate
+                    else:
+                        timeout = WAIT_POLL_SECONDS
+                    self._cond.wait(min(timeout, WAIT_POLL_SECONDS))
+                    raise_if_cancelled()
+            finally:
+                self._pending.remove(flow)
+                self._cond.notify_all()
+            self.counters["throttle_seconds"] += time.monotonic() - start
+
+    def stats(self):
+        with self._cond:
+            counters = dict(self.counters)
+            hosts = {}
+            for flow in self._active:
+                hosts[flow.host] = hosts.get(flow.host, 0) + 1
+            return dict(
+                counters,
+                slot_wait_seconds=round(counters["slot_wait_seconds"], 3),
+                throttle_seconds=round(counters["throttle_seconds"], 3),
+                limit_mbps=self.rate / 125000 or None,
+                active=len(self._active),
+                active_small=sum(1 for flow in self._active if flow.small),
+                waiting=len(self._waiting),
+                hosts=hosts
+            )
+
+
+bandwidth = BandwidthScheduler()
@@ -18,14 +18,25 @@
 
 import os
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
-from services.gcp_toolkit import upload_to_gcs
-from services.s3_toolkit import upload_to_s3
+from services.gcp_toolkit import upload_to_gcs, GCSStreamUpload
+from services.s3_toolkit import upload_to_s3, S3StreamUpload
+from services.job_control import current_job, attach
 from config import validate_env_vars
 from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of concurrent uploads per upload_files() call
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 8))
+
+# Providers hold no connections (clients live in services.storage_clients),
+# so one instance is shared by all threads and survives fork()
+_storage_provider = None
+_storage_provider_lock = threading.Lock()
+
 def parse_s3_url(s3_url):
     """Parse S3 URL to extract bucket name, region, and endpoint URL."""
     parsed_url = urlparse(s3_url)
@@ -40,15 +51,25 @@ def parse_s3_url(s3_url):
 
 class CloudStorageProvider(ABC):
     @abstractmethod
-    def upload_file(self, file_path: str) -> str:
+    def upload_file(self, file_path: str, keep_name: bool = False) -> str:
+        """Upload ``file_path``; ``keep_name`` keeps its basename as the object key
+        even with content-addressed keys (for files other files refer to by name)."""
+        pass
+
+    @abstractmethod
+    def open_upload(self, filename: str):
+        """Stream upload of ``filename``: ``write(data)``, then ``finish()`` -> URL, or ``abort()``."""
         pass
 
 class GCPStorageProvider(CloudStorageProvider):
     def __init__(self):
         self.bucket_name = os.getenv('GCP_BUCKET_NAME')
 
-    def upload_file(self, file_path: str) -> str:
-        return upload_to_gcs(file_path, self.bucket_name)
+    def upload_file(self, file_path: str, keep_name: bool = False) -> str:
+        return upload_to_gcs(file_path, self.bucket_name, keep_name)
+
+    def open_upload(self, filename: str):
+        return GCSStreamUpload(filename, self.bucket_name)
 
 class S3CompatibleProvider(CloudStorageProvider):
     def __init__(self):
@@ -83,10 +104,23 @@ class S3CompatibleProvider(CloudStorageProvider):
             except Exception as e:
                 logger.warning(f"Failed to parse Digital Ocean URL: {e}. Using provided values.")
 
-    def upload_file(self, file_path: str) -> str:
-        return upload_to_s3(file_path, self.endpoint_url, self.access_key, self.secret_key, self.bucket_name, self.region)
+    def upload_file(self, file_path: str, keep_name: bool = False) -> str:
+        return upload_to_s3(file_path, self.endpoint_url, self.access_key, self.secret_key, self.bucket_name, self.region,
+                            keep_name)
+
+    def open_upload(self, filename: str):
+        return S3StreamUpload(filename, self.endpoint_url, self.access_key, self.secret_key, self.bucket_name, self.region)
 
 def get_storage_provider() -> CloudStorageProvider:
+    """The configured provider, validated and built once per process."""
+    global _storage_provider
+    if _storage_provider is None:
+        with _storage_provider_lock:
+            if _storage_provider is None:
+                _storage_provider = _create_storage_provider()
+    return _storage_provider
+
+def _create_storage_provider() -> CloudStorageProvider:
     
     if os.getenv('S3_ENDPOINT_URL'):
 
@@ -105,14 +139,49 @@ def get_storage_provider() -> CloudStorageProvider:
     
     raise ValueError(f"No cloud storage settings provided.")
 
-def upload_file(file_path: str) -> str:
+def upload_file(file_path: str, keep_name: bool = False) -> str:
     provider = get_storage_provider()
     try:
         logger.info(f"Uploading file to cloud storage: {file_path}")
-        url = provider.upload_file(file_path)
+        url = provider.upload_file(file_path, keep_name)
         logger.info(f"File uploaded successfully: {url}")
         return url
     except Exception as e:
         logger.error(f"Error uploading file to cloud storage: {e}")
         raise
-    
\ No newline at end of file
+
+def open_upload_stream(filename: str):
+    """Start a streaming upload of ``filename`` with the configured provider (use as a context manager)."""
+    return get_storage_provider().open_upload(filename)
+
+def upload_files(file_paths, max_workers=UPLOAD_WORKERS):
+    """Upload several files concurrently with a bounded pool.
+
+    Uploads run on behalf of the calling job, so they honour its
+    cancellation.
+
+    Args:
+        file_paths (list): Local files to upload
+        max_workers (int): Maximum number of concurrent uploads
+
+    Returns:
+        list: URLs of the uploaded files, in the order of ``file_paths``
+    """
+    job = current_job()
+
+    def upload(file_path):
+        with attach(job):
+            return upload_file(file_path)
+
+    if len(file_paths) <= 1 or max_workers <= 1:
+        return [upload(file_path) for file_path in file_paths]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(file_paths)), thread_name_prefix="upload") as pool:
+        futures = [pool.submit(upload, file_path) for file_path in file_paths]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            # Do not start the remaining uploads of a failed job
+            for future in futures:
+                future.cancel()
+            raise
@@ -0,0 +1,219 @@
+# NCA-GPU-LEAN — Upload while encoding
+#
+# For outputs requested with ``"stream_upload": true`` the upload runs while
+# ffmpeg is still encoding, so it finishes seconds after the encode instead
+# of starting when the encode ends.
+#
+#   - Fragmented MP4/MOV, Matroska/WebM and MPEG-TS: ffmpeg writes into a
+#     FIFO. A reader thread copies the stream into the local output file
+#     (still used for metadata and thumbnails) and into a streaming upload
+#     of the storage provider (S3 multipart / GCS resumable). MP4/MOV
+#     outputs get fragmented movflags, since a regular MP4 needs a seekable
+#     file to write its index.
+#   - HLS: segments are uploaded as soon as the playlist lists them (ffmpeg
+#     only adds a segment once it is complete); the playlist is uploaded
+#     last, next to its segments.
+#
+# If ffmpeg fails or the job is stopped, streaming uploads are aborted and no
+# playlist is published (segments already uploaded stay in the bucket).
+
+import os
+import re
+import logging
+import threading
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from services.cloud_storage import open_upload_stream, upload_file
+from services.job_control import current_job, attach
+
+logger = logging.getLogger(__name__)
+
+# Output file extension -> ffmpeg muxer, for outputs that can be piped
+PIPE_MUXERS = {'mp4': 'mp4', 'mov': 'mov', 'mkv': 'matroska', 'webm': 'webm', 'ts': 'mpegts'}
+FRAGMENTED_MOVFLAGS = '+frag_keyframe+empty_moov+default_base_moof'
+PIPE_READ_BYTES = 1024 ** 2
+HLS_POLL_SECONDS = 0.5
+HLS_UPLOAD_WORKERS = int(os.environ.get('HLS_UPLOAD_WORKERS', 4))
+HLS_URI_PATTERN = re.compile(r'URI="([^"]+)"')
+
+
+def _option_value(options, name):
+    for option in options:
+        if option["option"] == name:
+            return option.get("argument")
+    return None
+
+
+class PipeOutputUpload:
+    """Tee ffmpeg's output from a FIFO into ``path`` and a streaming upload."""
+
+    def __init__(self, path, extension, options):
+        movflags = _option_value(options, '-movflags')
+        if extension in ('mp4', 'mov') and movflags is not None and 'frag' not in str(movflags):
+            raise ValueError("stream_upload needs a fragmented MP4 (-movflags frag_keyframe+empty_moov)")
+        self.path = path
+        self.target = f"{path}.fifo"
+        self.options = []
+        if _option_value(options, '-f') is None:
+            self.options += ['-f', PIPE_MUXERS[extension]]
+        if extension in ('mp4', 'mov') and movflags is None:
+            self.options += ['-movflags', FRAGMENTED_MOVFLAGS]
+        self.error = None
+        self._upload = None
+        self._stack = ExitStack()
+        self._thread = None
+        self._stats = None
+
+    def start(self):
+        os.mkfifo(self.target)
+        # Closed by finish() or abort(); the upload's __exit__ discards anything unfinished
+        self._upload = self._stack.enter_context(open_upload_stream(os.path.basename(self.path)))
+        self._thread = threading.Thread(target=self._pump, args=(current_job(),), name="encode-upload", daemon=True)
+        self._thread.start()
+
+    def _pump(self, job):
+        with attach(job), open(self.target, 'rb') as fifo, open(self.path, 'wb') as local:
+            while True:
+                data = fifo.read(PIPE_READ_BYTES)
+                if not data:
+                    break
+                local.write(data)
+                if self.error is None:
+                    try:
+                        self._upload.write(data)
+                    except BaseException as e:
+                        # Keep draining the FIFO so ffmpeg is not blocked
+                        self.error = e
+
+    def stop(self):
+        """Wait for the reader; unblock it if ffmpeg never opened the FIFO."""
+        if self._thread is None:
+            return
+        self._thread.join(0.1)
+        while self._thread.is_alive():
+            try:
+                # Opening and closing a writer makes the reader see end of file
+                os.close(os.open(self.target, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass  # the reader has not opened the FIFO yet
+            self._thread.join(0.1)
+        if os.path.exists(self.target):
+            os.remove(self.target)
+
+    def finish(self):
+        if self.error is not None:
+            raise self.error
+        with self._stack:
+            url = self._upload.finish()
+        self._stats = self._upload.stats
+        self._upload = None
+        return url
+
+    def stats(self):
+        return self._stats
+
+    def abort(self):
+        if self._upload is not None:
+            with self._stack:
+                self._upload.abort()
+            self._upload = None
+        if self._thread is None and os.path.exists(self.target):
+            os.remove(self.target)  # never started reading
+
+
+class HlsOutputUpload:
+    """Upload HLS segments while ffmpeg writes them, and the playlist at the end."""
+
+    def __init__(self, path, extension, options):
+        base = os.path.splitext(path)[0]
+        self.path = path
+        self.target = path
+        self.options = []
+        fmp4 = _option_value(options, '-hls_segment_type') == 'fmp4'
+        if _option_value(options, '-hls_segment_filename') is None:
+            self.options += ['-hls_segment_filename', f"{base}_%05d.{'m4s' if fmp4 else 'ts'}"]
+        if fmp4 and _option_value(options, '-hls_fmp4_init_filename') is None:
+            # The default name (init.mp4) would collide between jobs in the bucket
+            self.options += ['-hls_fmp4_init_filename', f"{os.path.basename(base)}_init.mp4"]
+        if _option_value(options, '-hls_list_size') is None:
+            self.options += ['-hls_list_size', '0']  # keep every segment in the final playlist
+        self._uploaded = {}
+        self._stop = threading.Event()
+        self._pool = None
+        self._thread = None
+
+    def start(self):
+        self._pool = ThreadPoolExecutor(max_workers=HLS_UPLOAD_WORKERS, thread_name_prefix="hls-upload")
+        self._thread = threading.Thread(target=self._watch, args=(current_job(),), name="hls-upload", daemon=True)
+        self._thread.start()
+
+    def _listed_files(self):
+        """Files the playlist references (segments and fMP4 init sections), in order."""
+        try:
+            with open(self.path) as playlist:
+                lines = playlist.read().splitlines()
+        except OSError:
+            return []
+        names = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith('#EXT-X-MAP'):
+                names.extend(HLS_URI_PATTERN.findall(line))
+            elif line and not line.startswith('#'):
+                names.append(line)
+        directory = os.path.dirname(self.path)
+        return [os.path.join(directory, name) for name in names]
+
+    def _upload_listed(self, job):
+        for segment in self._listed_files():
+            if segment not in self._uploaded and os.path.exists(segment):
+                self._uploaded[segment] = self._pool.submit(self._upload_segment, job, segment)
+
+    def _upload_segment(self, job, segment):
+        with attach(job):
+            # The playlist refers to segments by name
+            return upload_file(segment, keep_name=True)
+
+    def _watch(self, job):
+        while not self._stop.wait(HLS_POLL_SECONDS):
+            self._upload_listed(job)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+
+    def finish(self):
+        self._upload_listed(current_job())
+        for future in self._uploaded.values():
+            future.result()
+        self._pool.shutdown()
+        return upload_file(self.path, keep_name=True)
+
+    def stats(self):
+        return {"segments": len(self._uploaded)}
+
+    def abort(self):
+        if self._pool is None:
+            return
+        for future in self._uploaded.values():
+            future.cancel()
+        self._pool.shutdown(wait=True)
+
+
+def open_output_upload(path, extension, options):
+    """Streaming upload for an output written to ``path``.
+
+    The returned object's ``target`` replaces ``path`` as ffmpeg's output and
+    its ``options`` are added to the output options.
+
+    Raises:
+        ValueError: if the output format cannot be uploaded while encoding
+    """
+    if extension == 'm3u8':
+        return HlsOutputUpload(path, extension, options)
+    if extension in PIPE_MUXERS:
+        return PipeOutputUpload(path, extension, options)
+    raise ValueError(f"stream_upload is not supported for .{extension} outputs "
+                     f"(use fragmented MP4/MOV, MKV, WebM, MPEG-TS or HLS)")
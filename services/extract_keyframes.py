@@ -17,17 +17,17 @@
 
 
 import os
-import subprocess
 import json
 from services.file_management import download_file
-
-STORAGE_PATH = "/tmp/"
+from services.scratch import job_scratch_dir
+from services.job_control import run_process
 
 def process_keyframe_extraction(video_url, job_id):
-    video_path = download_file(video_url, STORAGE_PATH)
+    work_dir = job_scratch_dir()  # removed with everything in it when the job ends
+    video_path = download_file(video_url, work_dir)
 
     # Extract keyframes
-    output_pattern = os.path.join(STORAGE_PATH, f"{job_id}_%03d.jpg")
+    output_pattern = os.path.join(work_dir, f"{job_id}_%03d.jpg")
     cmd = [
         'ffmpeg',
         '-i', video_path,
@@ -38,13 +38,13 @@ def process_keyframe_extraction(video_url, job_id):
 
     print(f"Images: {cmd}")
 
-    subprocess.run(cmd, check=True)
+    run_process(cmd, check=True)
 
     # Upload keyframes to GCS and get URLs
     output_filenames = []
-    for filename in sorted(os.listdir(STORAGE_PATH)):
+    for filename in sorted(os.listdir(work_dir)):
         if filename.startswith(f"{job_id}_") and filename.endswith(".jpg"):
-            file_path = os.path.join(STORAGE_PATH, filename)
+            file_path = os.path.join(work_dir, filename)
             output_filenames.append(file_path)
 
     # Clean up input file
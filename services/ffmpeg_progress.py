@@ -0,0 +1,108 @@
+# NCA-GPU-LEAN — FFmpeg progress reporting
+#
+# process_ffmpeg_compose runs ffmpeg with ``-progress pipe:1 -nostats``:
+# ffmpeg then writes blocks of key=value lines to stdout, each terminated by
+# ``progress=continue`` (or ``progress=end`` for the last one). FFmpegProgress
+# parses them as they arrive and, at most every FFMPEG_PROGRESS_INTERVAL
+# seconds, merges the latest snapshot into the job record (visible through
+# /v1/toolkit/job/status) and optionally POSTs it to a progress webhook.
+# A stuck encode shows up as a snapshot whose ``updated_at`` stops moving.
+
+import os
+import time
+import logging
+from services.job_store import job_store
+from services.webhook import send_webhook
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_PROGRESS_INTERVAL = float(os.environ.get('FFMPEG_PROGRESS_INTERVAL', 2))
+FFMPEG_PROGRESS_WEBHOOK_INTERVAL = float(os.environ.get('FFMPEG_PROGRESS_WEBHOOK_INTERVAL', 10))
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+
+def _to_float(value):
+    """Parse '29.97', '1.5x' or 'N/A' (-> None)."""
+    try:
+        return float(str(value).rstrip('x'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FFmpegProgress:
+    """Incremental parser for ffmpeg ``-progress`` output of one job."""
+
+    def __init__(self, job_id, webhook_url=None):
+        self.job_id = job_id
+        self.webhook_url = webhook_url
+        self.started_at = time.time()
+        self.snapshot = None
+        self._fields = {}
+        self._speed_total = 0.0
+        self._speed_samples = 0
+        self._last_stored = 0
+        self._last_webhook = 0
+
+    def feed(self, line):
+        """Consume one line of ffmpeg progress output."""
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            return
+        self._fields[key] = value.strip()
+        if key == 'progress':
+            self._emit(final=value.strip() == 'end')
+
+    def _emit(self, final):
+        fields, self._fields = self._fields, {}
+        now = time.time()
+        # out_time_ms is in microseconds as well (long-standing ffmpeg quirk)
+        out_time_us = _to_int(fields.get('out_time_us') or fields.get('out_time_ms'))
+        speed = _to_float(fields.get('speed'))
+        if speed:
+            self._speed_total += speed
+            self._speed_samples += 1
+
+        self.snapshot = {
+            "state": "end" if final else "encoding",
+            "out_time": round(out_time_us / 1e6, 3) if out_time_us and out_time_us > 0 else 0,
+            "frame": _to_int(fields.get('frame')),
+            "fps": _to_float(fields.get('fps')),
+            "speed": speed,
+            "total_size": _to_int(fields.get('total_size')),
+            "elapsed": round(now - self.started_at, 3),
+            "updated_at": now
+        }
+
+        if final or now - self._last_stored >= FFMPEG_PROGRESS_INTERVAL:
+            self._last_stored = now
+            try:
+                job_store.update(self.job_id, {"progress": self.snapshot})
+            except Exception as e:
+                logger.warning(f"Job {self.job_id}: could not record progress: {e}")
+
+        if self.webhook_url and (final or now - self._last_webhook >= FFMPEG_PROGRESS_WEBHOOK_INTERVAL):
+            self._last_webhook = now
+            send_webhook(self.webhook_url, {
+                "job_id": self.job_id,
+                "job_status": "running",
+                "progress": self.snapshot
+            })
+
+    def summary(self):
+        """Encode telemetry for the job response."""
+        snapshot = self.snapshot or {}
+        encode_time = time.time() - self.started_at
+        return {
+            "encode_time": round(encode_time, 3),
+            "out_time": snapshot.get("out_time"),
+            "frames": snapshot.get("frame"),
+            "average_speed": round(self._speed_total / self._speed_samples, 3) if self._speed_samples else None,
+            "average_fps": round(snapshot["frame"] / encode_time, 2) if snapshot.get("frame") and encode_time else None
+        }
@@ -1,48 +1,28 @@
 import os
 import json
+import time
 import logging
 from google.oauth2 import service_account
-from google.cloud import storage
+from services.storage_clients import storage_clients
+from services.upload_dedup import upload_index
 from google.cloud.run_v2 import JobsClient, RunJobRequest
 from google.api_core.exceptions import GoogleAPIError
 
 logger = logging.getLogger(__name__)
 
-# Lazy-initialized GCS client — avoids network calls at import time
-_gcs_client = None
-_gcs_initialized = False
-
-
 def _get_gcs_client():
-    """Lazy-initialize the GCS client on first use."""
-    global _gcs_client, _gcs_initialized
-    if _gcs_initialized:
-        return _gcs_client
-
-    _gcs_initialized = True
-    GCP_SA_CREDENTIALS = os.getenv('GCP_SA_CREDENTIALS')
-
-    if not GCP_SA_CREDENTIALS:
+    """This worker's GCS client, or None when GCP credentials are not configured."""
+    if not os.getenv('GCP_SA_CREDENTIALS'):
         logger.info("GCP credentials not found. GCS uploads will not be available.")
         return None
-
-    GCS_SCOPES = ['https://www.googleapis.com/auth/devstorage.full_control']
-
     try:
-        credentials_info = json.loads(GCP_SA_CREDENTIALS)
-        gcs_credentials = service_account.Credentials.from_service_account_info(
-            credentials_info,
-            scopes=GCS_SCOPES
-        )
-        _gcs_client = storage.Client(credentials=gcs_credentials)
-        logger.info("GCS client initialized successfully.")
-        return _gcs_client
+        return storage_clients.gcs()
     except Exception as e:
         logger.error(f"Failed to initialize GCS client: {e}")
         return None
 
 
-def upload_to_gcs(file_path, bucket_name=None):
+def upload_to_gcs(file_path, bucket_name=None, keep_name=False):
     client = _get_gcs_client()
     if not client:
         raise ValueError("GCS client is not initialized. Check GCP_SA_CREDENTIALS.")
@@ -50,11 +30,28 @@ def upload_to_gcs(file_path, bucket_name=None):
     if not bucket_name:
         bucket_name = os.getenv('GCP_BUCKET_NAME')
 
+    bucket = client.bucket(bucket_name)
+
+    def put(key, digest):
+        blob = bucket.blob(key)
+        if digest:
+            blob.metadata = {'sha256': digest}
+        blob.upload_from_filename(file_path)
+
+    def head(key):
+        blob = bucket.get_blob(key)
+        if blob is None:
+            return None
+        return (blob.metadata or {}).get('sha256', '')
+
+    def copy(source_key, key):
+        bucket.copy_blob(bucket.blob(source_key), bucket, key)
+
     try:
         logger.info(f"Uploading file to Google Cloud Storage: {file_path}")
-        bucket = client.bucket(bucket_name)
-        blob = bucket.blob(os.path.basename(file_path))
-        blob.upload_from_filename(file_path)
+        # Upload the file (or reuse an identical object in the bucket)
+        key = upload_index.upload(file_path, f"gcs:{bucket_name}", put, head, copy, keep_name)
+        blob = bucket.blob(key)
         logger.info(f"File uploaded successfully to GCS: {blob.public_url}")
         return blob.public_url
     except Exception as e:
@@ -62,6 +59,68 @@ def upload_to_gcs(file_path, bucket_name=None):
         raise
 
 
+class GCSStreamUpload:
+    """Upload of data that is still being produced, as a GCS resumable upload.
+
+    ``write()`` the data, then ``finish()`` returns the public URL.
+    ``abort()`` (or leaving the ``with`` block without finishing) cancels the
+    resumable session, so no partial object is committed.
+    """
+
+    def __init__(self, filename, bucket_name=None):
+        client = _get_gcs_client()
+        if not client:
+            raise ValueError("GCS client is not initialized. Check GCP_SA_CREDENTIALS.")
+        self.blob = client.bucket(bucket_name or os.getenv('GCP_BUCKET_NAME')).blob(filename)
+        self.bytes = 0
+        self.stats = None
+        self._writer = None
+        self._finished = False
+        self._start_time = None
+
+    def __enter__(self):
+        self._writer = self.blob.open('wb')
+        self._start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._finished:
+            self.abort()
+        return False
+
+    def write(self, data):
+        self._writer.write(data)
+        self.bytes += len(data)
+
+    def finish(self):
+        self._writer.close()
+        self._finished = True
+        elapsed = time.time() - self._start_time
+        self.stats = {"bytes": self.bytes, "seconds": round(elapsed, 3)}
+        return self.blob.public_url
+
+    def abort(self):
+        """Cancel the resumable session (DELETE on its session URL)."""
+        if self._writer is None or self._finished:
+            return
+        writer, self._writer = self._writer, None
+        self._finished = True
+        try:
+            if hasattr(writer, 'terminate'):
+                writer.terminate()
+            elif writer._upload_and_transport:
+                upload, transport = writer._upload_and_transport
+                transport.delete(upload.upload_url)
+            logger.info(f"Cancelled resumable upload of {self.blob.name}")
+        except Exception as e:
+            logger.error(f"Failed to cancel resumable upload of {self.blob.name}: {e}")
+        finally:
+            # BlobWriter.close() - also called on garbage collection - would
+            # upload the buffered rest and commit a truncated object
+            if not writer.closed:
+                writer._buffer.close()
+
+
 def trigger_cloud_run_job(job_name, location="us-central1", overrides=None):
     json_str = os.environ.get("GCP_SA_CREDENTIALS")
     if not json_str:
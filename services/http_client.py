@@ -0,0 +1,128 @@
+# NCA-GPU-LEAN — Shared HTTP client
+#
+# All outbound HTTP (input downloads, HEAD probes, webhooks, streamed uploads)
+# goes through one requests.Session per worker process instead of the
+# module-level requests.get/head/post, which open a fresh TCP/TLS connection
+# for every call. The session keeps a keep-alive connection pool per host,
+# applies default connect/read timeouts and retries connection failures
+# (and 429/5xx answers to idempotent requests) with exponential backoff.
+#
+# The session never stores cookies: it serves every caller's downloads and
+# webhooks, so a cookie set by one caller's host must not reach later
+# requests made for another caller.
+#
+# stats() reports, per host, how many requests were served and how many
+# connections had to be opened for them: the difference is the number of
+# handshakes saved by keep-alive.
+
+import os
+import logging
+import threading
+import http.cookiejar
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 10))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 60))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 3))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.5))
+# Hosts kept in the pool manager, and keep-alive connections kept per host
+HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', 64))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 16))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class _Session(requests.Session):
+    """Session that applies the default timeouts to every request."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        return super().request(method, url, **kwargs)
+
+
+class HttpClient:
+    """One pooled session per process (sockets must not be shared across fork())."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._adapters = []
+
+    def _new_session(self):
+        retry = Retry(
+            total=HTTP_RETRIES,
+            backoff_factor=HTTP_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # idempotent methods only
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        session = _Session()
+        # Reject every cookie (no domain is allowed), so nothing persists between requests
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        self._adapters = []
+        for scheme in ('http://', 'https://'):
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+            session.mount(scheme, adapter)
+            self._adapters.append(adapter)
+        return session
+
+    @property
+    def session(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._session = self._new_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def stats(self):
+        """Requests vs. new connections per host for this process."""
+        self.session  # (re)creates the adapters in a fresh worker
+        hosts = {}
+        for adapter in self._adapters:
+            pools = adapter.poolmanager.pools
+            with pools.lock:
+                live = list(pools._container.values())
+            for pool in live:
+                host = f"{pool.scheme}://{pool.host}:{pool.port}"
+                counts = hosts.setdefault(host, [0, 0])
+                counts[0] += pool.num_requests
+                counts[1] += pool.num_connections
+        total_requests = sum(c[0] for c in hosts.values())
+        total_connections = sum(c[1] for c in hosts.values())
+
+        def summary(requests_count, connections):
+            return {
+                "requests": requests_count,
+                "connections": connections,
+                "reuse_rate": round(1 - connections / requests_count, 3) if requests_count else None
+            }
+
+        return dict(
+            summary(total_requests, total_connections),
+            hosts={host: summary(*counts) for host, counts in sorted(hosts.items())}
+        )
+
+
+http_client = HttpClient()
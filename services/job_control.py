@@ -0,0 +1,325 @@
+# NCA-GPU-LEAN — Job control: cancellation, deadlines and temp-file tracking
+#
+# Every job runs inside a JobContext (see job_context()). Services reach the
+# context of the job they are running for through current_job(), so they can:
+#   - start child processes with run_process(), which puts them in their own
+#     process group and kills the whole group on cancel or deadline;
+#   - call raise_if_cancelled() between steps / download chunks;
+#   - register_temp_path() for files that must be removed when the job ends.
+
+import os
+import time
+import signal
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Default deadline for a job in seconds (0 = none); overridable per request
+# with the ``job_timeout`` field.
+JOB_TIMEOUT = float(os.environ.get('JOB_TIMEOUT', 3600))
+JOB_KILL_GRACE_SECONDS = float(os.environ.get('JOB_KILL_GRACE_SECONDS', 5))
+JOB_CANCEL_POLL_INTERVAL = float(os.environ.get('JOB_CANCEL_POLL_INTERVAL', 1))
+
+# Response codes of stopped jobs (499: client closed request)
+JOB_STOP_CODES = {"cancelled": 499, "timeout": 504}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job that was cancelled through the API."""
+
+
+class JobTimeout(JobCancelled):
+    """Raised inside a job that ran past its deadline."""
+
+
+class JobContext:
+    def __init__(self, job_id, timeout=None):
+        self.job_id = job_id
+        self.started_at = time.time()
+        self.deadline = self.started_at + timeout if timeout else None
+        self.reason = None  # "cancelled" or "timeout" once stopped
+        self.stats = {}
+        self._event = threading.Event()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._temp_paths = set()
+        self._cleanups = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        """Stop the job: flag it and kill its child process groups."""
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+            self._event.set()
+            processes = list(self._processes)
+        for process in processes:
+            _kill_process_group(process)
+
+    def check(self):
+        """Raise JobCancelled/JobTimeout if the job must stop."""
+        if self.deadline and not self.cancelled and time.time() > self.deadline:
+            logger.warning(f"Job {self.job_id}: deadline exceeded, stopping")
+            self.cancel("timeout")
+        if self.cancelled:
+            if self.reason == "timeout":
+                raise JobTimeout(f"Job {self.job_id} exceeded its deadline")
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+
+    def wait(self, timeout=None):
+        """Wait for the job to leave its context; returns True if it did."""
+        return self._finished.wait(timeout)
+
+    def remaining(self):
+        return None if self.deadline is None else max(self.deadline - time.time(), 0)
+
+    def add_process(self, process):
+        with self._lock:
+            self._processes.add(process)
+
+    def remove_process(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def add_temp_path(self, path):
+        with self._lock:
+            self._temp_paths.add(path)
+
+    def add_cleanup(self, callback):
+        """Call ``callback()`` when the job ends."""
+        with self._lock:
+            self._cleanups.append(callback)
+
+    def cleanup(self):
+        """Remove every registered temp file that still exists and run the cleanup callbacks."""
+        with self._lock:
+            paths, self._temp_paths = list(self._temp_paths), set()
+            callbacks, self._cleanups = self._cleanups, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Job {self.job_id}: cleanup failed: {e}")
+        for path in paths:
+            try:
+                if os.path.isfile(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"Job {self.job_id}: could not remove {path}: {e}")
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_local = threading.local()
+
+
+def _kill_process_group(process):
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+
+    def escalate():
+        try:
+            process.wait(JOB_KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    threading.Thread(target=escalate, daemon=True).start()
+
+
+@contextmanager
+def job_context(job_id, timeout=None):
+    """Run the enclosed block as job ``job_id`` on the current thread.
+
+    ``timeout`` is the deadline in seconds (see get_job_timeout()).
+    """
+    ctx = JobContext(job_id, timeout)
+    with _jobs_lock:
+        _jobs[job_id] = ctx
+    previous = getattr(_local, 'ctx', None)
+    _local.ctx = ctx
+    try:
+        yield ctx
+    finally:
+        _local.ctx = previous
+        with _jobs_lock:
+            _jobs.pop(job_id, None)
+        ctx.cleanup()
+        ctx._finished.set()
+
+
+def get_job_timeout(data):
+    """Deadline in seconds for a job payload (``job_timeout`` or JOB_TIMEOUT), None for no deadline."""
+    try:
+        timeout = float(data.get('job_timeout') or JOB_TIMEOUT)
+    except (TypeError, ValueError):
+        timeout = JOB_TIMEOUT
+    return timeout if timeout > 0 else None
+
+
+def current_job():
+    """The JobContext of the job running on this thread, or None."""
+    return getattr(_local, 'ctx', None)
+
+
+@contextmanager
+def attach(ctx):
+    """Make ``ctx`` the current job on a helper thread (e.g. a download pool)."""
+    previous = getattr(_local, 'ctx', None)
+    _local.ctx = ctx
+    try:
+        yield ctx
+    finally:
+        _local.ctx = previous
+
+
+def raise_if_cancelled():
+    ctx = current_job()
+    if ctx:
+        ctx.check()
+
+
+def register_temp_path(path):
+    """Remove ``path`` when the current job ends (success, failure or cancel)."""
+    ctx = current_job()
+    if ctx:
+        ctx.add_temp_path(path)
+    return path
+
+
+def record_stat(key, value):
+    """Attach telemetry to the current job; it is returned under ``stats`` in the job response."""
+    ctx = current_job()
+    if ctx:
+        with ctx._lock:
+            ctx.stats[key] = value
+
+
+def active_jobs():
+    with _jobs_lock:
+        return list(_jobs)
+
+
+def cancel_job(job_id, reason="cancelled", wait=None):
+    """Cancel a job running in this process.
+
+    Returns:
+        None if the job is not running here, otherwise whether it stopped
+        within ``wait`` seconds.
+    """
+    with _jobs_lock:
+        ctx = _jobs.get(job_id)
+    if not ctx:
+        return None
+    logger.info(f"Job {job_id}: {reason}")
+    ctx.cancel(reason)
+    return ctx.wait(wait) if wait else False
+
+
+def _pump(pipe, sink):
+    try:
+        for line in pipe:
+            sink(line)
+    except Exception as e:
+        logger.error(f"Error reading process output: {e}")
+    finally:
+        pipe.close()
+
+
+def run_process(command, check=False, text=True, timeout=None, on_stdout_line=None, **kwargs):
+    """subprocess.run() replacement that honours cancellation and deadlines.
+
+    The child runs in its own session/process group so that ffmpeg and
+    anything it spawns are killed together. With ``on_stdout_line`` the
+    child's stdout is streamed line by line to that callback instead of
+    being collected (``stdout`` of the result is then None).
+
+    Returns:
+        subprocess.CompletedProcess
+
+    Raises:
+        JobCancelled / JobTimeout: if the job was stopped while running
+        subprocess.TimeoutExpired: if the command ran longer than ``timeout``
+        subprocess.CalledProcessError: if ``check`` and the exit code is non-zero
+    """
+    ctx = current_job()
+    kwargs.setdefault('stdout', subprocess.PIPE)
+    kwargs.setdefault('stderr', subprocess.PIPE)
+    started = time.time()
+    process = subprocess.Popen(command, text=text, start_new_session=True, **kwargs)
+    if ctx:
+        ctx.add_process(process)
+
+    readers, stderr_lines = [], []
+    if on_stdout_line:
+        readers = [
+            threading.Thread(target=_pump, args=(process.stdout, on_stdout_line), daemon=True),
+            threading.Thread(target=_pump, args=(process.stderr, stderr_lines.append), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+
+    def collect(wait_timeout=None):
+        if not readers:
+            return process.communicate(timeout=wait_timeout)
+        process.wait(timeout=wait_timeout)
+        for reader in readers:
+            reader.join()
+        return None, ("" if text else b"").join(stderr_lines)
+
+    try:
+        while True:
+            try:
+                stdout, stderr = collect(0.5)
+                break
+            except subprocess.TimeoutExpired:
+                try:
+                    if ctx:
+                        ctx.check()
+                    if timeout and time.time() - started > timeout:
+                        raise subprocess.TimeoutExpired(command, timeout)
+                except (JobCancelled, subprocess.TimeoutExpired):
+                    _kill_process_group(process)
+                    collect()
+                    raise
+    finally:
+        if ctx:
+            ctx.remove_process(process)
+
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def start_cancel_watcher(get_requested):
+    """Poll for cancel requests made through other worker processes.
+
+    ``get_requested(job_ids)`` returns the subset of ``job_ids`` that have a
+    pending cancel request.
+    """
+    def watch():
+        while True:
+            time.sleep(JOB_CANCEL_POLL_INTERVAL)
+            job_ids = active_jobs()
+            if not job_ids:
+                continue
+            try:
+                for job_id in get_requested(job_ids):
+                    cancel_job(job_id)
+            except Exception as e:
+                logger.error(f"Cancel watcher error: {e}")
+
+    threading.Thread(target=watch, name="job-cancel-watcher", daemon=True).start()
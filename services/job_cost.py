@@ -0,0 +1,148 @@
+# NCA-GPU-LEAN — Job cost estimation
+#
+# Cheap up-front estimate of how expensive a queued job will be, used by the
+# scheduler to prefer short jobs. Inputs are sized with a HEAD request and,
+# when JOB_COST_ESTIMATE=ffprobe, their duration is probed as well.
+#
+# The estimate runs on the request thread before the job is accepted, so all
+# probes run concurrently under one deadline (JOB_COST_DEADLINE); probes that
+# miss it count as unknown. Results are cached per URL for JOB_COST_CACHE_TTL
+# seconds, and a late probe still fills the cache for the next job.
+
+import os
+import json
+import logging
+import time
+import threading
+import subprocess
+import requests
+from collections import OrderedDict
+from services.http_client import http_client
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# off | head | ffprobe
+JOB_COST_ESTIMATE = os.environ.get('JOB_COST_ESTIMATE', 'head').lower()
+JOB_COST_TIMEOUT = float(os.environ.get('JOB_COST_TIMEOUT', 2))
+# Longest the estimate may hold up the submission of a job, all probes together
+JOB_COST_DEADLINE = float(os.environ.get('JOB_COST_DEADLINE', 2))
+JOB_COST_CACHE_TTL = float(os.environ.get('JOB_COST_CACHE_TTL', 300))
+JOB_COST_CACHE_SIZE = 1024
+# Rough processing throughput used to turn input bytes into seconds of work
+JOB_COST_BYTES_PER_SECOND = float(os.environ.get('JOB_COST_BYTES_PER_SECOND', 20 * 1024 * 1024))
+MAX_PROBED_URLS = 8
+
+
+def get_input_urls(data):
+    """Collect the remote inputs referenced by a job payload."""
+    urls = []
+    if data.get("file_url"):
+        urls.append(data["file_url"])
+    for input_data in data.get("inputs", []) or []:
+        if isinstance(input_data, dict) and input_data.get("file_url"):
+            urls.append(input_data["file_url"])
+    # Preserve order, drop duplicates
+    return list(dict.fromkeys(u for u in urls if u.startswith(("http://", "https://"))))
+
+
+def head_content_length(url, headers=None):
+    """Return the Content-Length advertised for ``url``, or None."""
+    try:
+        response = http_client.head(url, allow_redirects=True, timeout=JOB_COST_TIMEOUT, headers=headers)
+        length = response.headers.get('content-length')
+        return int(length) if length else None
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def probe_duration(url):
+    """Return the media duration in seconds reported by ffprobe, or None."""
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format', url],
+            capture_output=True, text=True, timeout=JOB_COST_TIMEOUT * 5
+        )
+        return float(json.loads(result.stdout)['format']['duration'])
+    except (subprocess.SubprocessError, OSError, ValueError, KeyError):
+        return None
+
+
+class ProbeCache:
+    """Recent probe results (including unknowns) keyed by probe, URL and headers."""
+
+    def __init__(self, ttl=JOB_COST_CACHE_TTL, size=JOB_COST_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return ``(True, value)`` for a fresh entry, else ``(False, None)``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                return False, None
+            return True, entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+probe_cache = ProbeCache()
+
+
+def _cached(probe, url, headers=None):
+    key = (probe.__name__, url, tuple(sorted(headers.items())) if headers else None)
+    found, value = probe_cache.get(key)
+    if found:
+        return value
+    value = probe(url, headers) if headers else probe(url)
+    probe_cache.put(key, value)
+    return value
+
+
+def estimate_job_cost(data):
+    """Estimate the inputs of a job.
+
+    Returns:
+        dict: ``input_bytes``, ``duration`` (either may be None when unknown),
+        ``input_sizes`` (URL -> Content-Length of the inputs whose size is
+        known) and ``cost``, the estimated seconds of work used for scheduling.
+    """
+    estimate = {"input_bytes": None, "input_sizes": {}, "duration": None, "cost": 1.0}
+    urls = get_input_urls(data)[:MAX_PROBED_URLS]
+    if JOB_COST_ESTIMATE == 'off' or not urls:
+        return estimate
+
+    headers = data.get("download_headers")
+    probes = [(head_content_length, headers)]
+    if JOB_COST_ESTIMATE == 'ffprobe':
+        probes.append((probe_duration, None))
+    pool = ThreadPoolExecutor(max_workers=len(urls) * len(probes), thread_name_prefix="job-cost")
+    futures = [[pool.submit(_cached, probe, url, probe_headers) for url in urls] for probe, probe_headers in probes]
+    wait([future for row in futures for future in row], timeout=JOB_COST_DEADLINE)
+    # Probes still running finish in the background and only fill the cache
+    pool.shutdown(wait=False)
+    results = [[future.result() if future.done() and not future.exception() else None for future in row]
+               for row in futures]
+    sizes = results[0]
+    durations = results[1] if len(results) > 1 else []
+
+    estimate["input_sizes"] = {url: size for url, size in zip(urls, sizes) if size is not None}
+    if estimate["input_sizes"]:
+        estimate["input_bytes"] = sum(estimate["input_sizes"].values())
+    known_durations = [d for d in durations if d is not None]
+    if known_durations:
+        estimate["duration"] = max(known_durations)
+
+    if estimate["duration"] is not None:
+        estimate["cost"] = estimate["duration"]
+    elif estimate["input_bytes"] is not None:
+        estimate["cost"] = estimate["input_bytes"] / JOB_COST_BYTES_PER_SECOND
+    logger.debug(f"Estimated job cost for {len(urls)} input(s): {estimate}")
+    return estimate
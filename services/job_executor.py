@@ -0,0 +1,190 @@
+# NCA-GPU-LEAN — Job executor pools
+#
+# Queued (webhook) jobs are drained by a set of worker pools instead of a
+# single thread. Each pool has its own queue and slot count so that a long
+# NVENC compose never blocks an S3 upload and vice versa:
+#   - cpu: CPU-bound work (software encodes, python execution)
+#   - gpu: NVENC encodes, one slot per encoder you want in flight
+#   - io:  network-bound transfers (S3/GCS uploads)
+#
+# Within a pool, jobs are ordered by services.job_scheduler.JobScheduler.
+
+import os
+import glob
+import logging
+import threading
+from concurrent.futures import Future
+from services.job_scheduler import JobScheduler
+
+logger = logging.getLogger(__name__)
+
+POOL_CPU = "cpu"
+POOL_GPU = "gpu"
+POOL_IO = "io"
+
+
+def _default_gpu_slots():
+    """One slot per visible NVIDIA device, 0 when running without a GPU."""
+    return len(glob.glob('/dev/nvidia[0-9]*'))
+
+
+def get_pool_slots():
+    """Read the slot count of every pool from the environment."""
+    return {
+        POOL_CPU: max(1, int(os.environ.get('CPU_POOL_SIZE', 1))),
+        POOL_GPU: max(0, int(os.environ.get('GPU_POOL_SIZE', _default_gpu_slots()))),
+        POOL_IO: max(1, int(os.environ.get('IO_POOL_SIZE', 4))),
+    }
+
+
+class _Call:
+    """A blocking call submitted through JobExecutor.run()."""
+
+    __slots__ = ("func", "future", "job_id")
+
+    def __init__(self, func, job_id=None):
+        self.func = func
+        self.future = Future()
+        self.job_id = job_id
+
+
+class JobExecutor:
+    """Fixed-size worker pools draining one queue each.
+
+    ``handler`` is called as ``handler(pool, *item)`` for every submitted item
+    on one of the pool's worker threads, in the order chosen by the pool's
+    scheduler.
+    """
+
+    def __init__(self, handler, slots=None):
+        self.handler = handler
+        self.slots = slots or get_pool_slots()
+        self.queues = {pool: JobScheduler() for pool in self.slots}
+        self.busy = {pool: 0 for pool in self.slots}
+        self._lock = threading.Lock()
+        self._started_pid = None
+
+    def resolve_pool(self, pool):
+        """Map a requested pool to one that has slots (GPU falls back to CPU)."""
+        if pool not in self.slots:
+            pool = POOL_CPU
+        if self.slots[pool] == 0:
+            pool = POOL_CPU
+        return pool
+
+    def start(self):
+        """Start the worker threads once per process.
+
+        Threads do not survive ``fork()``, so with gunicorn's ``preload_app``
+        the workers are (re)started lazily in each worker process.
+        """
+        with self._lock:
+            pid = os.getpid()
+            if self._started_pid == pid:
+                return
+            self._started_pid = pid
+            self.busy = {pool: 0 for pool in self.slots}
+
+        for pool, count in self.slots.items():
+            for i in range(count):
+                threading.Thread(
+                    target=self._worker,
+                    args=(pool,),
+                    name=f"job-{pool}-{i}",
+                    daemon=True
+                ).start()
+        logger.info(f"Job executor started in pid {os.getpid()}: {self.slots}")
+
+    def submit(self, pool, item, priority=0, tenant=None, cost=1.0):
+        """Queue an item tuple on ``pool`` and return the pool it was queued on."""
+        self.start()
+        pool = self.resolve_pool(pool)
+        self.queues[pool].put(item, priority=priority, tenant=tenant, cost=cost)
+        return pool
+
+    def run(self, pool, func, priority=0, tenant=None, cost=1.0, job_id=None):
+        """Run ``func()`` on a slot of ``pool`` and block until it returns its result."""
+        call = _Call(func, job_id)
+        self.submit(pool, call, priority=priority, tenant=tenant, cost=cost)
+        return call.future.result()
+
+    def cancel_queued(self, job_id, exception=None):
+        """Remove a job that has not started yet from whichever pool holds it.
+
+        Returns ``(pool, item)`` with the removed item tuple, or ``True`` as item
+        for a blocking ``run()`` call (which is failed with ``exception``);
+        ``None`` if the job is not queued.
+        """
+        def matches(item):
+            if isinstance(item, _Call):
+                return item.job_id == job_id
+            return item[0] == job_id
+
+        for pool, queue in self.queues.items():
+            item = queue.remove(matches)
+            if item is None:
+                continue
+            if isinstance(item, _Call):
+                item.future.set_exception(exception or RuntimeError(f"Job {job_id} was cancelled"))
+                return pool, True
+            return pool, item
+        return None
+
+    def peek(self, n):
+        """``(job_id, data)`` of the next ``n`` queued jobs of every pool.
+
+        Blocking run() calls carry no payload and are left out.
+        """
+        jobs = []
+        for queue in self.queues.values():
+            jobs.extend((item[0], item[1]) for item in queue.peek(n) if not isinstance(item, _Call))
+        return jobs
+
+    def qsize(self, pool=None):
+        """Number of queued (not yet running) items, for one pool or all of them."""
+        if pool is not None:
+            return self.queues[self.resolve_pool(pool)].qsize()
+        return sum(q.qsize() for q in self.queues.values())
+
+    def occupancy(self, tenants=False):
+        """Per-pool slots, running and queued counts.
+
+        ``tenants`` adds the queued jobs per tenant; that identifies other
+        callers, so it is only for operators (/v1/toolkit/metrics), never for
+        job responses or webhooks.
+        """
+        with self._lock:
+            busy = dict(self.busy)
+        occupancy = {
+            pool: {
+                "slots": self.slots[pool],
+                "running": busy[pool],
+                "queued": self.queues[pool].qsize()
+            }
+            for pool in self.slots
+        }
+        if tenants:
+            for pool in self.slots:
+                occupancy[pool]["tenants"] = self.queues[pool].tenants()
+        return occupancy
+
+    def _worker(self, pool):
+        queue = self.queues[pool]
+        while True:
+            item = queue.get()
+            with self._lock:
+                self.busy[pool] += 1
+            try:
+                if isinstance(item, _Call):
+                    try:
+                        item.future.set_result(item.func())
+                    except BaseException as e:
+                        item.future.set_exception(e)
+                else:
+                    self.handler(pool, *item)
+            except Exception as e:
+                logger.exception(f"Unhandled error in {pool} pool worker: {e}")
+            finally:
+                with self._lock:
+                    self.busy[pool] -= 1
+                queue.task_done()
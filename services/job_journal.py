@@ -0,0 +1,249 @@
+# NCA-GPU-LEAN — Durable job journal
+#
+# Every queued job is written to an SQLite database (WAL mode) under
+# LOCAL_STORAGE_PATH/jobs before the 202 is returned, and removed once its
+# result has been handed to the webhook. When a gunicorn worker is recycled or
+# the container is preempted, the next worker replays whatever is left so the
+# caller still receives a webhook.
+#
+# Writes are group-committed by a single writer thread: concurrent enqueues
+# share one transaction, so an enqueue costs one WAL append, not one fsync.
+
+import os
+import json
+import time
+import uuid
+import logging
+import sqlite3
+import threading
+from config import LOCAL_STORAGE_PATH
+
+logger = logging.getLogger(__name__)
+
+JOB_JOURNAL_ENABLED = os.environ.get('JOB_JOURNAL', 'true').lower() in ['true', '1']
+JOB_JOURNAL_PATH = os.environ.get('JOB_JOURNAL_PATH', os.path.join(LOCAL_STORAGE_PATH, 'jobs', 'queue.db'))
+# NORMAL survives process crashes; FULL also survives power loss at the cost
+# of an fsync per group commit.
+JOB_JOURNAL_SYNC = os.environ.get('JOB_JOURNAL_SYNC', 'NORMAL').upper()
+JOB_JOURNAL_MAX_ATTEMPTS = int(os.environ.get('JOB_JOURNAL_MAX_ATTEMPTS', 3))
+# How long a replay that is turned away (429/503) keeps being retried
+JOB_JOURNAL_REPLAY_RETRY_SECONDS = int(os.environ.get('JOB_JOURNAL_REPLAY_RETRY_SECONDS', 600))
+JOB_JOURNAL_COMMIT_TIMEOUT = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queued_jobs (
+    job_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    pool TEXT,
+    state TEXT NOT NULL,
+    owner_pid TEXT NOT NULL,  -- process_token() of the owning worker
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL
+)
+"""
+
+
+def pid_alive(pid):
+    """True if a process with this pid exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _process_start_time(pid):
+    """Start time of ``pid`` in clock ticks since boot, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces and parentheses; the fields after it do not
+    return stat.rsplit(')', 1)[1].split()[19]
+
+
+_process_token = (None, None)
+
+
+def process_token():
+    """Owner token of this process run: "<pid>-<start time>".
+
+    A restarted container hands out the same pids again, so a bare pid
+    cannot tell this run from the one that wrote a leftover record. Where
+    the start time cannot be read, a random id takes its place.
+    """
+    global _process_token
+    pid = os.getpid()
+    if _process_token[0] != pid:
+        _process_token = (pid, f"{pid}-{_process_start_time(pid) or uuid.uuid4().hex}")
+    return _process_token[1]
+
+
+def owner_alive(token):
+    """True if the process run that wrote owner ``token`` is still running."""
+    token = str(token)
+    if token == process_token():
+        return True
+    pid, _, start = token.partition('-')
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return False  # an earlier run that had this process's pid
+    if not pid_alive(int(pid)):
+        return False
+    current = _process_start_time(int(pid))
+    if current is None or not start:
+        return True  # cannot tell a reused pid apart
+    return current == start
+
+
+class JobJournal:
+    """Append/remove log of queued jobs with group commit."""
+
+    def __init__(self, path=JOB_JOURNAL_PATH):
+        self.path = path
+        self._cond = threading.Condition()
+        self._pending = []  # (sql, params, done_event or None)
+        self._db_lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+
+    def _ensure_started(self):
+        # Connections and threads do not survive fork(); open them per process.
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={JOB_JOURNAL_SYNC}")
+            conn.execute(SCHEMA)
+            self._conn = conn
+            self._db_lock = threading.Lock()
+            self._pending = []
+            self._pid = os.getpid()
+            threading.Thread(target=self._writer, name="job-journal", daemon=True).start()
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                batch, self._pending = self._pending, []
+            with self._db_lock:
+                try:
+                    self._conn.execute("BEGIN IMMEDIATE")
+                    for sql, params, _ in batch:
+                        self._conn.execute(sql, params)
+                    self._conn.execute("COMMIT")
+                except sqlite3.Error as e:
+                    logger.error(f"Job journal commit of {len(batch)} op(s) failed: {e}")
+                    try:
+                        self._conn.execute("ROLLBACK")
+                    except sqlite3.Error:
+                        pass
+            for _, _, event in batch:
+                if event:
+                    event.set()
+
+    def _submit(self, sql, params, wait=False):
+        if not JOB_JOURNAL_ENABLED:
+            return
+        self._ensure_started()
+        event = threading.Event() if wait else None
+        with self._cond:
+            self._pending.append((sql, params, event))
+            self._cond.notify()
+        if event and not event.wait(JOB_JOURNAL_COMMIT_TIMEOUT):
+            logger.warning("Job journal commit is taking longer than expected")
+
+    def enqueue(self, job_id, path, payload, pool):
+        """Persist a queued job; returns once the group commit is done."""
+        self._submit(
+            "INSERT INTO queued_jobs (job_id, path, payload, pool, state, owner_pid, attempts, enqueued_at) "
+            "VALUES (?, ?, ?, ?, 'queued', ?, 0, ?) "
+            "ON CONFLICT(job_id) DO UPDATE SET payload=excluded.payload, pool=excluded.pool, "
+            "state=CASE WHEN state='cancel' THEN state ELSE 'queued' END, owner_pid=excluded.owner_pid",
+            (job_id, path, json.dumps(payload), pool, process_token(), time.time()),
+            wait=True
+        )
+
+    def mark_running(self, job_id):
+        # A cancel request recorded while the job was queued must survive
+        self._submit(
+            "UPDATE queued_jobs SET state=CASE WHEN state='cancel' THEN state ELSE 'running' END, "
+            "attempts=attempts+1 WHERE job_id=?",
+            (job_id,)
+        )
+
+    def complete(self, job_id):
+        self._submit("DELETE FROM queued_jobs WHERE job_id=?", (job_id,))
+
+    def request_cancel(self, job_id):
+        """Flag a journaled job for cancellation by whichever worker owns it.
+
+        Returns:
+            bool: False if the job is not in the journal.
+        """
+        if not JOB_JOURNAL_ENABLED:
+            return False
+        self._ensure_started()
+        with self._db_lock:
+            cursor = self._conn.execute("UPDATE queued_jobs SET state='cancel' WHERE job_id=?", (job_id,))
+            return cursor.rowcount == 1
+
+    def cancel_requested(self, job_ids):
+        """The subset of ``job_ids`` flagged by request_cancel()."""
+        if not JOB_JOURNAL_ENABLED or not job_ids:
+            return set()
+        self._ensure_started()
+        placeholders = ",".join("?" * len(job_ids))
+        with self._db_lock:
+            rows = self._conn.execute(
+                f"SELECT job_id FROM queued_jobs WHERE state='cancel' AND job_id IN ({placeholders})",
+                list(job_ids)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def claim_orphans(self):
+        """Take ownership of jobs whose worker process is gone.
+
+        Returns:
+            list: dicts with ``job_id``, ``path``, ``payload``, ``pool`` and
+            ``attempts`` for every job claimed by this process.
+        """
+        if not JOB_JOURNAL_ENABLED:
+            return []
+        self._ensure_started()
+        owner = process_token()
+        claimed = []
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT job_id, path, payload, pool, owner_pid, attempts FROM queued_jobs ORDER BY enqueued_at"
+            ).fetchall()
+            for job_id, path, payload, pool, owner_pid, attempts in rows:
+                if owner_alive(owner_pid):
+                    continue
+                cursor = self._conn.execute(
+                    "UPDATE queued_jobs SET owner_pid=?, state=CASE WHEN state='cancel' THEN state ELSE 'queued' END "
+                    "WHERE job_id=? AND owner_pid=?",
+                    (owner, job_id, owner_pid)
+                )
+                if cursor.rowcount == 1:
+                    claimed.append({
+                        "job_id": job_id,
+                        "path": path,
+                        "payload": json.loads(payload),
+                        "pool": pool,
+                        "attempts": attempts
+                    })
+        if claimed:
+            logger.info(f"Job journal: claimed {len(claimed)} unfinished job(s) from previous workers")
+        return claimed
+
+
+job_journal = JobJournal()
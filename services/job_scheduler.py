@@ -0,0 +1,153 @@
+# NCA-GPU-LEAN — Job scheduler
+#
+# Drop-in replacement for the FIFO queue.Queue that feeds each executor pool.
+# Selection order for the next job:
+#   1. highest request ``priority``
+#   2. tenant that has received the least service so far (fair share)
+#   3. cheapest estimated job first, aged by time spent waiting
+#   4. arrival order
+
+import os
+import time
+import hashlib
+import itertools
+import threading
+
+DEFAULT_TENANT = "default"
+
+# How jobs are grouped for fair share: "id" uses the prefix of the request
+# ``id`` up to JOB_TENANT_SEPARATOR (e.g. "acme:render-42" -> "acme"),
+# "api_key" uses the caller's X-API-Key.
+FAIR_SHARE_KEY = os.environ.get('FAIR_SHARE_KEY', 'id').lower()
+JOB_TENANT_SEPARATOR = os.environ.get('JOB_TENANT_SEPARATOR', ':')
+
+# Waiting this many seconds halves a job's effective cost, so expensive jobs
+# cannot be starved forever by a stream of cheap ones.
+SCHEDULER_AGING_SECONDS = float(os.environ.get('SCHEDULER_AGING_SECONDS', 60))
+
+
+def get_job_tenant(data, api_key=None):
+    """Return the fair-share key for a job payload."""
+    if FAIR_SHARE_KEY == 'api_key':
+        return hashlib.sha256(api_key.encode()).hexdigest()[:12] if api_key else DEFAULT_TENANT
+    job_ref = str(data.get("id") or "")
+    if JOB_TENANT_SEPARATOR and JOB_TENANT_SEPARATOR in job_ref:
+        return job_ref.split(JOB_TENANT_SEPARATOR, 1)[0] or DEFAULT_TENANT
+    return DEFAULT_TENANT
+
+
+def parse_priority(value):
+    """Coerce a request ``priority`` field to an int (0 when missing or invalid)."""
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class _Entry:
+    __slots__ = ("item", "priority", "tenant", "cost", "seq", "enqueued_at")
+
+    def __init__(self, item, priority, tenant, cost, seq):
+        self.item = item
+        self.priority = priority
+        self.tenant = tenant
+        self.cost = cost
+        self.seq = seq
+        self.enqueued_at = time.time()
+
+    def aged_cost(self, now):
+        waited = now - self.enqueued_at
+        return self.cost / (1.0 + waited / SCHEDULER_AGING_SECONDS)
+
+
+class JobScheduler:
+    """Priority + fair-share + shortest-job-first queue.
+
+    Exposes the subset of the ``queue.Queue`` interface the executor uses
+    (``put``, ``get``, ``qsize``, ``task_done``).
+    """
+
+    def __init__(self):
+        self._pending = {}  # tenant -> [_Entry]
+        self._service = {}  # tenant -> accumulated cost of dispatched jobs
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._size = 0
+
+    def put(self, item, priority=0, tenant=DEFAULT_TENANT, cost=1.0):
+        with self._cond:
+            tenant = tenant or DEFAULT_TENANT
+            if tenant not in self._pending or not self._pending[tenant]:
+                # A tenant returning from idle starts level with the least
+                # served active tenant instead of cashing in old credit.
+                active = [self._service.get(t, 0.0) for t, q in self._pending.items() if q]
+                floor = min(active) if active else 0.0
+                self._service[tenant] = max(self._service.get(tenant, 0.0), floor)
+                self._pending.setdefault(tenant, [])
+            self._pending[tenant].append(
+                _Entry(item, int(priority or 0), tenant, max(float(cost or 0), 0.001), next(self._seq))
+            )
+            self._size += 1
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while self._size == 0:
+                self._cond.wait()
+            entry = self._select(time.time())
+            self._pending[entry.tenant].remove(entry)
+            self._service[entry.tenant] = self._service.get(entry.tenant, 0.0) + entry.cost
+            self._size -= 1
+            return entry.item
+
+    def qsize(self):
+        with self._cond:
+            return self._size
+
+    def task_done(self):
+        pass
+
+    def remove(self, predicate):
+        """Remove and return the first queued item for which ``predicate(item)`` is true."""
+        with self._cond:
+            for entries in self._pending.values():
+                for entry in entries:
+                    if predicate(entry.item):
+                        entries.remove(entry)
+                        self._size -= 1
+                        return entry.item
+        return None
+
+    def peek(self, n):
+        """The next ``n`` queued items, in the order get() would return them now."""
+        with self._cond:
+            now = time.time()
+            service = dict(self._service)
+            taken = set()
+            items = []
+            for _ in range(min(n, self._size)):
+                entry = self._select(now, service, taken)
+                taken.add(entry.seq)
+                service[entry.tenant] = service.get(entry.tenant, 0.0) + entry.cost
+                items.append(entry.item)
+            return items
+
+    def tenants(self):
+        """Number of queued jobs per tenant."""
+        with self._cond:
+            return {t: len(q) for t, q in self._pending.items() if q}
+
+    def _select(self, now, service=None, exclude=()):
+        service = self._service if service is None else service
+        best, best_key = None, None
+        for tenant, entries in self._pending.items():
+            if not entries:
+                continue
+            share = service.get(tenant, 0.0)
+            for entry in entries:
+                if entry.seq in exclude:
+                    continue
+                key = (-entry.priority, share, entry.aged_cost(now), entry.seq)
+                if best_key is None or key < best_key:
+                    best, best_key = entry, key
+        return best
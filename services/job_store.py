@@ -0,0 +1,404 @@
+# NCA-GPU-LEAN — Job status store
+#
+# Job status records live in one SQLite database (WAL mode) under
+# LOCAL_STORAGE_PATH/jobs instead of one JSON file per job. The table is
+# indexed by update time and by status, so single-job lookups and
+# "jobs updated in the last N seconds" queries no longer scan the directory.
+# Records written by this process are also kept in a small in-memory LRU so
+# status polling of running jobs does not touch the disk at all.
+#
+# A background compactor keeps the store bounded: records older than
+# JOB_RETENTION_SECONDS, or beyond JOB_STORE_MAX_RECORDS, are rolled into
+# gzip-compressed daily segments (jobs/segments/YYYY-MM-DD.jsonl.gz) that
+# stay queryable through a small job_id index. Segments older than
+# JOB_SEGMENT_RETENTION_DAYS are deleted. Every worker runs the compactor,
+# but an flock on jobs/compact.lock lets only one of them compact at a time.
+
+import os
+import glob
+import gzip
+import json
+import time
+import fcntl
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from config import LOCAL_STORAGE_PATH
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.path.join(LOCAL_STORAGE_PATH, 'jobs')
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', os.path.join(JOBS_DIR, 'status.db'))
+JOB_STORE_CACHE_SIZE = int(os.environ.get('JOB_STORE_CACHE_SIZE', 1024))
+SEGMENTS_DIR = os.path.join(JOBS_DIR, 'segments')
+COMPACT_LOCK_PATH = os.path.join(JOBS_DIR, 'compact.lock')
+
+# Retention policies (0 disables the policy)
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', 24 * 3600))
+JOB_STORE_MAX_RECORDS = int(os.environ.get('JOB_STORE_MAX_RECORDS', 100000))
+JOB_SEGMENT_RETENTION_DAYS = int(os.environ.get('JOB_SEGMENT_RETENTION_DAYS', 30))
+JOB_COMPACT_INTERVAL = int(os.environ.get('JOB_COMPACT_INTERVAL', 3600))
+COMPACT_BATCH_SIZE = 5000
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS job_status (
+        job_id TEXT PRIMARY KEY,
+        status TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        record TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_job_status_updated ON job_status (updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_job_status_status ON job_status (status, updated_at)",
+    """
+    CREATE TABLE IF NOT EXISTS archived_jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT,
+        updated_at REAL NOT NULL,
+        segment TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_archived_jobs_updated ON archived_jobs (updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_archived_jobs_status ON archived_jobs (status, updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_archived_jobs_segment ON archived_jobs (segment)",
+]
+
+
+def _file_size(path):
+    # 0 for files removed meanwhile (e.g. a segment deleted by another process's compactor)
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+class JobStore:
+    """Indexed job status records with a hot cache of locally written jobs."""
+
+    def __init__(self, path=JOB_STORE_PATH, cache_size=JOB_STORE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._pid = None
+        self._conn = None
+        self._compactor_pid = None
+
+    def _connection(self):
+        # SQLite connections must not be shared across fork(); reopen per process.
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+            self._cache = OrderedDict()
+            self._pid = os.getpid()
+        return self._conn
+
+    def _remember(self, job_id, record):
+        self._cache[job_id] = record
+        self._cache.move_to_end(job_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def put(self, job_id, record):
+        """Insert or replace the status record of a job."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO job_status (job_id, status, created_at, updated_at, record) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET status=excluded.status, "
+                "updated_at=excluded.updated_at, record=excluded.record",
+                (job_id, record.get("job_status"), now, now, json.dumps(record))
+            )
+            self._remember(job_id, record)
+
+    def update(self, job_id, fields):
+        """Merge ``fields`` into the record of a running job (e.g. its progress)."""
+        record = self.get(job_id)
+        if record is None or record.get("job_status") != "running":
+            return
+        self.put(job_id, dict(record, **fields))
+
+    def get(self, job_id):
+        """Return the status record of a job, or None if it is unknown."""
+        with self._lock:
+            conn = self._connection()
+            if job_id in self._cache:
+                self._cache.move_to_end(job_id)
+                return self._cache[job_id]
+            row = conn.execute("SELECT record FROM job_status WHERE job_id=?", (job_id,)).fetchone()
+            archived = None
+            if not row:
+                archived = conn.execute("SELECT segment FROM archived_jobs WHERE job_id=?", (job_id,)).fetchone()
+        if row:
+            return json.loads(row[0])
+        if archived:
+            return self._get_archived(job_id, archived[0])
+        return self._get_legacy(job_id)
+
+    def _get_archived(self, job_id, segment):
+        segment_path = os.path.join(SEGMENTS_DIR, segment)
+        if not os.path.exists(segment_path):
+            return None
+        needle = json.dumps(job_id)
+        try:
+            with gzip.open(segment_path, 'rt') as f:
+                for line in f:
+                    if needle in line:
+                        entry = json.loads(line)
+                        if entry.get("job_id") == job_id:
+                            return entry["record"]
+        except FileNotFoundError:
+            pass  # deleted by the compactor in the meantime
+        return None
+
+    def _get_legacy(self, job_id):
+        # Records written by older builds as jobs/<job_id>.json
+        legacy_path = os.path.join(JOBS_DIR, f"{os.path.basename(job_id)}.json")
+        if not os.path.exists(legacy_path):
+            return None
+        with open(legacy_path, 'r') as f:
+            return json.load(f)
+
+    def list(self, since=None, statuses=None, limit=None, cursor=None):
+        """List ``(job_id, status, updated_at)`` newest first.
+
+        Args:
+            since (float, optional): Only jobs updated at or after this timestamp
+            statuses (list, optional): Only jobs in one of these statuses
+            limit (int, optional): Maximum number of rows to return
+            cursor (str, optional): ``next_cursor`` from a previous page
+
+        Returns:
+            tuple: (rows, next_cursor) where next_cursor is None on the last page
+        """
+        clauses, params = [], []
+        if since is not None:
+            clauses.append("updated_at >= ?")
+            params.append(since)
+        if statuses:
+            clauses.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if cursor:
+            cursor_time, cursor_job = cursor.split(":", 1)
+            clauses.append("(updated_at < ? OR (updated_at = ? AND job_id < ?))")
+            params.extend([float(cursor_time), float(cursor_time), cursor_job])
+
+        sql = (
+            "SELECT job_id, status, updated_at FROM ("
+            "SELECT job_id, status, updated_at FROM job_status UNION ALL "
+            "SELECT job_id, status, updated_at FROM archived_jobs)"
+        )
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY updated_at DESC, job_id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit) + 1)
+
+        with self._lock:
+            rows = self._connection().execute(sql, params).fetchall()
+
+        next_cursor = None
+        if limit and len(rows) > int(limit):
+            rows = rows[:int(limit)]
+            next_cursor = f"{rows[-1][2]!r}:{rows[-1][0]}"
+        return rows, next_cursor
+
+    # ------------------------------------------------------------------ #
+    # Retention and compaction
+    # ------------------------------------------------------------------ #
+    def start_compactor(self):
+        """Run compact() every JOB_COMPACT_INTERVAL seconds in this process."""
+        if JOB_COMPACT_INTERVAL <= 0 or self._compactor_pid == os.getpid():
+            return
+        self._compactor_pid = os.getpid()
+
+        def run():
+            while True:
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Job store compaction failed: {e}")
+                time.sleep(JOB_COMPACT_INTERVAL)
+
+        threading.Thread(target=run, name="job-store-compactor", daemon=True).start()
+
+    @contextmanager
+    def _compact_lock(self):
+        """Exclusive, non-blocking flock on COMPACT_LOCK_PATH; yields False if another process holds it."""
+        os.makedirs(os.path.dirname(COMPACT_LOCK_PATH), exist_ok=True)
+        with open(COMPACT_LOCK_PATH, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def compact(self):
+        """Apply the retention policies once, unless another process is compacting.
+
+        Returns:
+            dict: number of records archived and segments deleted.
+        """
+        with self._compact_lock() as acquired:
+            if not acquired:
+                logger.debug("Job store compaction skipped: another process is compacting")
+                return {"archived": 0, "deleted_segments": 0}
+            return self._compact()
+
+    def _compact(self):
+        archived = 0
+        now = time.time()
+        while True:
+            with self._lock:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = self._select_expired(conn, now)
+                    if rows:
+                        self._archive(conn, rows)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            archived += len(rows)
+            if len(rows) < COMPACT_BATCH_SIZE:
+                break
+
+        archived += self._archive_legacy_files(now)
+        deleted_segments = self._delete_old_segments(now)
+        if archived or deleted_segments:
+            logger.info(f"Job store compaction: archived {archived} record(s), deleted {deleted_segments} segment(s)")
+        return {"archived": archived, "deleted_segments": deleted_segments}
+
+    def _select_expired(self, conn, now):
+        rows = []
+        if JOB_RETENTION_SECONDS > 0:
+            rows = conn.execute(
+                "SELECT job_id, status, updated_at, record FROM job_status "
+                "WHERE updated_at < ? ORDER BY updated_at LIMIT ?",
+                (now - JOB_RETENTION_SECONDS, COMPACT_BATCH_SIZE)
+            ).fetchall()
+        if not rows and JOB_STORE_MAX_RECORDS > 0:
+            excess = conn.execute("SELECT COUNT(*) FROM job_status").fetchone()[0] - JOB_STORE_MAX_RECORDS
+            if excess > 0:
+                rows = conn.execute(
+                    "SELECT job_id, status, updated_at, record FROM job_status ORDER BY updated_at LIMIT ?",
+                    (min(excess, COMPACT_BATCH_SIZE),)
+                ).fetchall()
+        return rows
+
+    def _archive(self, conn, rows):
+        """Append rows to their daily segments and move them to the archive index."""
+        by_segment = {}
+        for job_id, status, updated_at, record in rows:
+            segment = time.strftime('%Y-%m-%d', time.gmtime(updated_at)) + '.jsonl.gz'
+            by_segment.setdefault(segment, []).append((job_id, status, updated_at, record))
+
+        os.makedirs(SEGMENTS_DIR, exist_ok=True)
+        for segment, entries in by_segment.items():
+            # Each append adds a gzip member; readers see one continuous stream
+            with gzip.open(os.path.join(SEGMENTS_DIR, segment), 'at') as f:
+                for job_id, status, updated_at, record in entries:
+                    f.write(json.dumps({
+                        "job_id": job_id,
+                        "status": status,
+                        "updated_at": updated_at,
+                        "record": json.loads(record)
+                    }) + "\n")
+            conn.executemany(
+                "INSERT OR REPLACE INTO archived_jobs (job_id, status, updated_at, segment) VALUES (?, ?, ?, ?)",
+                [(job_id, status, updated_at, segment) for job_id, status, updated_at, _ in entries]
+            )
+            conn.executemany("DELETE FROM job_status WHERE job_id=?", [(e[0],) for e in entries])
+
+    def _archive_legacy_files(self, now):
+        # jobs/<job_id>.json files written by older builds
+        if JOB_RETENTION_SECONDS <= 0:
+            return 0
+        rows = []
+        for legacy_path in glob.glob(os.path.join(JOBS_DIR, '*.json')):
+            try:
+                mtime = os.path.getmtime(legacy_path)
+                if mtime >= now - JOB_RETENTION_SECONDS:
+                    continue
+                with open(legacy_path, 'r') as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            job_id = os.path.basename(legacy_path)[:-len('.json')]
+            rows.append((job_id, record.get("job_status"), mtime, json.dumps(record), legacy_path))
+            if len(rows) >= COMPACT_BATCH_SIZE:
+                break
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._archive(conn, [row[:4] for row in rows])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        for row in rows:
+            try:
+                os.remove(row[4])
+            except OSError:
+                pass
+        return len(rows)
+
+    def _delete_old_segments(self, now):
+        if JOB_SEGMENT_RETENTION_DAYS <= 0:
+            return 0
+        cutoff = time.strftime('%Y-%m-%d', time.gmtime(now - JOB_SEGMENT_RETENTION_DAYS * 86400))
+        deleted = 0
+        for segment_path in sorted(glob.glob(os.path.join(SEGMENTS_DIR, '*.jsonl.gz'))):
+            segment = os.path.basename(segment_path)
+            if segment[:10] >= cutoff:
+                continue
+            with self._lock:
+                self._connection().execute("DELETE FROM archived_jobs WHERE segment=?", (segment,))
+            try:
+                os.remove(segment_path)
+            except FileNotFoundError:
+                continue  # already deleted
+            deleted += 1
+        return deleted
+
+    def stats(self):
+        """Size and record counts of the store."""
+        with self._lock:
+            conn = self._connection()
+            records = conn.execute("SELECT COUNT(*) FROM job_status").fetchone()[0]
+            archived_records = conn.execute("SELECT COUNT(*) FROM archived_jobs").fetchone()[0]
+        db_bytes = sum(_file_size(p) for p in (self.path, self.path + '-wal', self.path + '-shm'))
+        segments = glob.glob(os.path.join(SEGMENTS_DIR, '*.jsonl.gz'))
+        return {
+            "records": records,
+            "archived_records": archived_records,
+            "db_bytes": db_bytes,
+            "segments": len(segments),
+            "segment_bytes": sum(_file_size(p) for p in segments),
+            "cached_records": len(self._cache),
+            "retention_seconds": JOB_RETENTION_SECONDS,
+            "max_records": JOB_STORE_MAX_RECORDS,
+            "segment_retention_days": JOB_SEGMENT_RETENTION_DAYS
+        }
+
+
+job_store = JobStore()
@@ -0,0 +1,235 @@
+# NCA-GPU-LEAN — Shared media input cache
+#
+# Inputs fetched by download_file() are kept in LOCAL_STORAGE_PATH/cache,
+# keyed by URL and validated with the origin's ETag / Last-Modified through a
+# conditional GET, so a B-roll, logo or music URL reused by hundreds of jobs
+# is only transferred again when it changes (a 304 costs one round trip).
+#
+#   - Every job gets its own hard link to the cached file. The link count is
+#     the reference count: files still linked by a job are never evicted,
+#     and a job deleting its input only drops its own link.
+#   - Concurrent fetches of the same URL (threads or gunicorn workers) are
+#     serialized by an flock on a per-URL lock file; the waiters reuse what
+#     the first fetch stored.
+#   - Least recently used files are evicted once the cache grows beyond
+#     MEDIA_CACHE_MAX_BYTES.
+#   - Responses without ETag or Last-Modified are not cached.
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from services.http_client import http_client
+from config import LOCAL_STORAGE_PATH
+from services.job_control import register_temp_path
+from services.range_download import write_response
+from services.media_type import ExtensionProbe
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CACHE_ENABLED = os.environ.get('MEDIA_CACHE', 'true').lower() in ['true', '1']
+MEDIA_CACHE_DIR = os.environ.get('MEDIA_CACHE_DIR', os.path.join(LOCAL_STORAGE_PATH, 'cache'))
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get('MEDIA_CACHE_MAX_BYTES', 10 * 1024 ** 3))
+# Serve cached files without revalidating for this many seconds (0 = always revalidate)
+MEDIA_CACHE_FRESH_SECONDS = float(os.environ.get('MEDIA_CACHE_FRESH_SECONDS', 0))
+KEY_LENGTH = 64  # sha256 hex digest
+
+
+class MediaCache:
+    """URL-keyed, validator-checked file cache shared by all worker processes."""
+
+    def __init__(self, directory=MEDIA_CACHE_DIR, max_bytes=MEDIA_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "not_modified": 0,
+            "misses": 0,
+            "uncacheable": 0,
+            "evictions": 0,
+            "bytes_downloaded": 0,
+            "bytes_saved": 0
+        }
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _base(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    @contextmanager
+    def _locked(self, base, blocking=True):
+        """Exclusive flock on ``base``.lock; yields False if non-blocking and busy."""
+        with open(base + '.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_meta(self, base):
+        try:
+            with open(base + '.json') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if "extension" not in meta or not os.path.exists(meta.get("path", "")):
+            return None
+        return meta
+
+    def _write_meta(self, base, meta):
+        tmp = f"{base}.json.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, base + '.json')
+
+    def _link(self, data_path, storage_path, extension):
+        """Give the caller its own link to a cached file."""
+        local_filename = register_temp_path(os.path.join(storage_path, f"{uuid.uuid4()}{extension}"))
+        try:
+            os.link(data_path, local_filename)
+        except OSError:
+            # Different filesystem: fall back to a private copy
+            shutil.copyfile(data_path, local_filename)
+        now = time.time()
+        os.utime(data_path, (now, now))  # mtime orders the LRU
+        return local_filename
+
+    def fetch(self, url, storage_path):
+        """Return a local path under ``storage_path`` holding the content of ``url``.
+
+        Raises:
+            requests.RequestException: if the download fails
+            ValueError: if the response is not a media file or has no known type
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        os.makedirs(storage_path, exist_ok=True)
+        base = self._base(url)
+        requested_at = time.time()
+
+        with self._locked(base):
+            meta = self._read_meta(base)
+            headers = {}
+            if meta:
+                # Fetched by someone else while we waited for the lock, or still fresh
+                if meta["validated_at"] >= requested_at or \
+                        time.time() - meta["validated_at"] < MEDIA_CACHE_FRESH_SECONDS:
+                    self._count("hits")
+                    self._count("bytes_saved", meta["size"])
+                    return self._link(meta["path"], storage_path, meta["extension"])
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("last_modified"):
+                    headers["If-Modified-Since"] = meta["last_modified"]
+
+            response = http_client.get(url, stream=True, headers=headers)
+            with response:
+                if meta and response.status_code == 304:
+                    meta["validated_at"] = time.time()
+                    self._write_meta(base, meta)
+                    self._count("not_modified")
+                    self._count("bytes_saved", meta["size"])
+                    return self._link(meta["path"], storage_path, meta["extension"])
+                response.raise_for_status()
+
+                tmp = f"{base}.{os.getpid()}.{threading.get_ident()}.part"
+                probe = ExtensionProbe(url, response)
+                try:
+                    size = write_response(response, tmp, on_first_chunk=probe)
+                    extension = probe.result()
+                except BaseException:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+                    raise
+                self._count("bytes_downloaded", size)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+
+            if not (etag or last_modified):
+                self._count("uncacheable")
+                local_filename = register_temp_path(os.path.join(storage_path, f"{uuid.uuid4()}{extension}"))
+                shutil.move(tmp, local_filename)
+                return local_filename
+
+            data_path = base + extension
+            if meta and meta["path"] != data_path and os.path.exists(meta["path"]):
+                os.remove(meta["path"])
+            os.replace(tmp, data_path)
+            self._write_meta(base, {
+                "url": url,
+                "path": data_path,
+                "extension": extension,
+                "size": size,
+                "etag": etag,
+                "last_modified": last_modified,
+                "validated_at": time.time()
+            })
+            self._count("misses")
+            local_filename = self._link(data_path, storage_path, extension)
+
+        self.evict()
+        return local_filename
+
+    def _entries(self):
+        """(mtime, size, nlink, path) of every cached data file."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(('.json', '.lock', '.part', '.tmp')):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, st.st_nlink, entry.path))
+        return entries
+
+    def evict(self):
+        """Remove least recently used, unreferenced files until under budget."""
+        entries = self._entries()
+        total = sum(size for _, size, _, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for mtime, size, nlink, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if nlink > 1:
+                continue  # still linked by a running job
+            base = os.path.join(self.directory, os.path.basename(path)[:KEY_LENGTH])
+            with self._locked(base, blocking=False) as locked:
+                if not locked:
+                    continue  # being fetched or linked right now
+                for stale in (path, base + '.json'):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+            total -= size
+            self._count("evictions")
+            logger.info(f"Media cache: evicted {os.path.basename(path)} ({size} bytes)")
+
+    def stats(self):
+        entries = self._entries() if os.path.isdir(self.directory) else []
+        with self._lock:
+            counters = dict(self.counters)
+        return dict(
+            counters,
+            enabled=MEDIA_CACHE_ENABLED,
+            files=len(entries),
+            bytes=sum(size for _, size, _, _ in entries),
+            max_bytes=self.max_bytes,
+            in_use=sum(1 for _, _, nlink, _ in entries if nlink > 1)
+        )
+
+
+media_cache = MediaCache()
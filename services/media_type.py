@@ -0,0 +1,121 @@
+# NCA-GPU-LEAN — Media type detection for downloads
+#
+# Inputs are fetched with a single GET. The file extension (which ffmpeg
+# uses to pick a demuxer for some formats) is taken, in order, from:
+#   1. the URL path,
+#   2. the response's Content-Disposition filename,
+#   3. the response's Content-Type (unless it is a generic octet-stream),
+#   4. the magic bytes of the first chunk of the body.
+# The first chunk is inspected before anything is written, so an HTML error
+# or login page served in place of a media file is rejected immediately
+# instead of after downloading it.
+
+import os
+import re
+import mimetypes
+from urllib.parse import urlparse, unquote
+
+GENERIC_CONTENT_TYPES = ['application/octet-stream', 'binary/octet-stream', 'application/binary', '']
+
+# (offset, signature, extension); checked in order
+MAGIC_SIGNATURES = [
+    (0, b'\x1a\x45\xdf\xa3', '.mkv'),
+    (0, b'OggS', '.ogg'),
+    (0, b'fLaC', '.flac'),
+    (0, b'ID3', '.mp3'),
+    (0, b'\x89PNG\r\n\x1a\n', '.png'),
+    (0, b'\xff\xd8\xff', '.jpg'),
+    (0, b'GIF87a', '.gif'),
+    (0, b'GIF89a', '.gif'),
+    (0, b'\x00\x00\x01\xba', '.mpg'),
+    (0, b'FLV', '.flv'),
+    (0, b'[Script Info]', '.ass'),
+    (0, b'WEBVTT', '.vtt'),
+]
+
+QUICKTIME_BRANDS = {b'qt  ': '.mov', b'M4A ': '.m4a', b'M4B ': '.m4a', b'3gp4': '.3gp', b'3gp5': '.3gp'}
+RIFF_TYPES = {b'WAVE': '.wav', b'AVI ': '.avi', b'WEBP': '.webp'}
+SRT_PATTERN = re.compile(rb'^\s*\d+\s*\r?\n\d{2}:\d{2}:\d{2}[,.]\d{3} --> ')
+
+
+class NotMediaError(ValueError):
+    """The URL returned something that is not a media file (e.g. an HTML page)."""
+
+
+def extension_from_url(url):
+    """Extension of the URL path (lowercase, with dot), or None."""
+    ext = os.path.splitext(urlparse(url).path)[1].lower()
+    return ext or None
+
+
+def extension_from_headers(headers):
+    """Extension from Content-Disposition or a specific Content-Type, or None."""
+    disposition = headers.get('Content-Disposition', '')
+    match = re.search(r"filename\*\s*=\s*[^']*'[^']*'([^;]+)", disposition) or \
+        re.search(r'filename\s*=\s*"?([^";]+)"?', disposition)
+    if match:
+        ext = os.path.splitext(unquote(match.group(1).strip()))[1].lower()
+        if ext:
+            return ext
+
+    content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type not in GENERIC_CONTENT_TYPES:
+        ext = mimetypes.guess_extension(content_type)
+        if ext:
+            return ext.lower()
+    return None
+
+
+def looks_like_html(head):
+    start = head.lstrip()[:64].lower()
+    return start.startswith((b'<!doctype html', b'<html', b'<head', b'<body'))
+
+
+def sniff_extension(head):
+    """Extension from the magic bytes at the start of a file, or None."""
+    if head[4:8] == b'ftyp':
+        return QUICKTIME_BRANDS.get(head[8:12], '.mp4')
+    if head[:4] == b'RIFF':
+        return RIFF_TYPES.get(head[8:12])
+    if head[:4] == b'\x1a\x45\xdf\xa3' and b'webm' in head[:64]:
+        return '.webm'
+    for offset, signature, ext in MAGIC_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return ext
+    if head[:1] == b'\xff' and len(head) > 1 and head[1] & 0xe0 == 0xe0:
+        return '.aac' if head[1] & 0x06 == 0 else '.mp3'  # ADTS vs MPEG audio frame sync
+    if head[:1] == b'\x47' and len(head) > 188 and head[188:189] == b'\x47':
+        return '.ts'
+    if SRT_PATTERN.match(head[:256].lstrip(b'\xef\xbb\xbf')):
+        return '.srt'
+    return None
+
+
+class ExtensionProbe:
+    """Callback for write_response(): decides the extension from the first chunk.
+
+    Raises NotMediaError for HTML pages and ValueError when no extension can
+    be determined, before the body is written.
+    """
+
+    def __init__(self, url, response):
+        self.url = url
+        self.headers = response.headers
+        self.extension = None
+        self._checked = False
+
+    def __call__(self, head):
+        self._checked = True
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type == 'text/html' or looks_like_html(head):
+            raise NotMediaError(f"URL returned an HTML page instead of a media file: {self.url}")
+        self.extension = extension_from_url(self.url) or extension_from_headers(self.headers) or \
+            sniff_extension(head)
+        if not self.extension:
+            raise ValueError(f"Could not determine file extension from URL: {self.url}")
+
+    def result(self):
+        """The extension, also for empty bodies where no chunk was seen."""
+        if not self._checked:
+            self(b'')
+        return self.extension
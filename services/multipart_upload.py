@@ -0,0 +1,190 @@
+# NCA-GPU-LEAN — Pipelined S3 multipart upload
+#
+# MultipartUpload accepts data with write() and uploads it as S3 parts on a
+# small thread pool while the caller keeps producing (downloading, encoding)
+# the next bytes, so the two legs overlap instead of alternating.
+#
+#   - Up to S3_UPLOAD_CONCURRENCY parts are in flight at once.
+#   - Parts that are buffered or in flight never exceed S3_UPLOAD_MEMORY_BYTES
+#     (plus the part being filled); write() blocks until memory is released.
+#   - The part size starts at S3_UPLOAD_PART_BYTES and grows so the upload
+#     stays within S3's 10,000 part limit: when the total size is known it is
+#     chosen up front, otherwise it doubles every 1,000 parts.
+#   - Any failure (including cancellation of the job) aborts the multipart
+#     upload, so no orphaned parts are left behind in the bucket.
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.job_control import raise_if_cancelled, current_job, attach
+
+logger = logging.getLogger(__name__)
+
+S3_UPLOAD_CONCURRENCY = int(os.environ.get('S3_UPLOAD_CONCURRENCY', 4))
+S3_UPLOAD_PART_BYTES = int(os.environ.get('S3_UPLOAD_PART_BYTES', 8 * 1024 ** 2))
+S3_UPLOAD_MEMORY_BYTES = int(os.environ.get('S3_UPLOAD_MEMORY_BYTES', 256 * 1024 ** 2))
+MIN_PART_BYTES = 5 * 1024 ** 2  # S3 minimum for all but the last part
+MAX_PART_BYTES = 5 * 1024 ** 3
+MAX_PARTS = 10000
+GROWTH_INTERVAL = 1000  # parts between part size doublings when the size is unknown
+
+
+def part_size_for(total_size=None, part_number=1):
+    """Part size to use for ``part_number`` of an upload of ``total_size`` bytes (None if unknown)."""
+    base = max(S3_UPLOAD_PART_BYTES, MIN_PART_BYTES)
+    if total_size:
+        size = max(base, -(-total_size // MAX_PARTS))
+        size = -(-size // 1024 ** 2) * 1024 ** 2  # round up to whole MiB
+    else:
+        size = base * 2 ** ((part_number - 1) // GROWTH_INTERVAL)
+    return min(size, MAX_PART_BYTES)
+
+
+class MultipartUpload:
+    """Context manager around one S3 multipart upload.
+
+    Usage::
+
+        with MultipartUpload(client, bucket, key, size=n, ACL='private') as upload:
+            for chunk in source:
+                upload.write(chunk)
+            upload.complete()
+
+    Leaving the block without complete() (or with an exception) aborts it.
+    """
+
+    def __init__(self, client, bucket, key, size=None, concurrency=S3_UPLOAD_CONCURRENCY,
+                 memory_bytes=S3_UPLOAD_MEMORY_BYTES, **create_args):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.concurrency = max(1, concurrency)
+        self.memory_bytes = memory_bytes
+        self.create_args = create_args
+        self.upload_id = None
+        self.bytes = 0
+        self._buffer = bytearray()
+        self._part_number = 1
+        self._parts = {}
+        self._futures = []
+        self._in_flight = 0
+        self._in_flight_bytes = 0
+        self._error = None
+        self._cond = threading.Condition()
+        self._pool = None
+        self._completed = False
+        self._start_time = None
+
+    def __enter__(self):
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self.create_args)
+        self.upload_id = response['UploadId']
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="s3-part")
+        self._start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._completed:
+            self.abort()
+        return False
+
+    def write(self, data):
+        """Buffer ``data`` and start uploading every part that is full."""
+        self._buffer.extend(data)
+        self.bytes += len(data)
+        while len(self._buffer) >= part_size_for(self.size, self._part_number):
+            size = part_size_for(self.size, self._part_number)
+            body = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            self._submit(body)
+
+    def _submit(self, body):
+        with self._cond:
+            while self._error is None and self._in_flight and (
+                    self._in_flight >= self.concurrency or
+                    self._in_flight_bytes + len(body) > self.memory_bytes):
+                self._cond.wait(1.0)
+                raise_if_cancelled()
+            if self._error is not None:
+                raise self._error
+            self._in_flight += 1
+            self._in_flight_bytes += len(body)
+        part_number = self._part_number
+        self._part_number += 1
+        self._futures.append(self._pool.submit(self._upload_part, current_job(), part_number, body))
+
+    def _upload_part(self, job, part_number, body):
+        try:
+            with attach(job):
+                raise_if_cancelled()
+                response = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    PartNumber=part_number,
+                    UploadId=self.upload_id,
+                    Body=body
+                )
+            with self._cond:
+                self._parts[part_number] = response['ETag']
+        except BaseException as e:
+            with self._cond:
+                if self._error is None:
+                    self._error = e
+            raise
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._in_flight_bytes -= len(body)
+                self._cond.notify_all()
+
+    def complete(self):
+        """Upload the remaining data, wait for all parts and finish the upload.
+
+        Returns:
+            dict: parts, part size, bytes, seconds and throughput of the upload
+        """
+        if self._buffer or self._part_number == 1:
+            body = bytes(self._buffer)
+            self._buffer = bytearray()
+            self._submit(body)
+        for future in self._futures:
+            future.result()
+        if self._error is not None:
+            raise self._error
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': number, 'ETag': etag} for number, etag in sorted(self._parts.items())
+            ]}
+        )
+        self._completed = True
+        self._pool.shutdown(wait=False)
+        elapsed = time.time() - self._start_time
+        summary = {
+            "parts": len(self._parts),
+            "part_bytes": part_size_for(self.size, 1),
+            "bytes": self.bytes,
+            "seconds": round(elapsed, 3),
+            "mb_per_second": round(self.bytes / max(elapsed, 0.001) / 1024 ** 2, 1)
+        }
+        logger.info(f"Multipart upload of {self.key} complete: {summary}")
+        return summary
+
+    def abort(self):
+        """Stop pending parts and abort the upload so S3 discards the uploaded ones."""
+        if self.upload_id is None or self._completed:
+            return
+        for future in self._futures:
+            future.cancel()
+        if self._pool:
+            self._pool.shutdown(wait=True)
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            logger.info(f"Aborted multipart upload of {self.key} ({self.upload_id})")
+        except Exception as e:
+            logger.error(f"Failed to abort multipart upload of {self.key} ({self.upload_id}): {e}")
+        self._completed = True
@@ -0,0 +1,176 @@
+# NCA-GPU-LEAN — Input prefetch for queued jobs
+#
+# While a job waits in its pool, its inputs are already downloaded into the
+# directory the job will use as scratch space, so queue time and fetch time
+# overlap instead of adding up. Every PREFETCH_INTERVAL seconds the next
+# PREFETCH_JOBS jobs of each pool (in scheduler order) are looked at, and
+# their input URLs are fetched by PREFETCH_WORKERS background threads.
+#
+#   - Inputs that ffmpeg streams over HTTP are not prefetched.
+#   - A URL is only prefetched when its Content-Length is known and fits the
+#     PREFETCH_MAX_BYTES budget; the bytes stay booked until the job ends.
+#   - When the job runs, download_files() claims prefetched files instead of
+#     downloading them, waiting for a prefetch that is still in progress.
+#   - A job that is cancelled while queued drops its prefetched files.
+
+import os
+import time
+import shutil
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from services.job_control import register_temp_path, raise_if_cancelled
+from services.job_cost import head_content_length
+from services.scratch import scratch
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_JOBS = int(os.environ.get('PREFETCH_JOBS', 2))  # per pool, 0 disables prefetching
+PREFETCH_MAX_BYTES = int(os.environ.get('PREFETCH_MAX_BYTES', 4 * 1024 ** 3))
+PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', 2))
+PREFETCH_INTERVAL = float(os.environ.get('PREFETCH_INTERVAL', 1.0))
+
+
+class Prefetcher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}  # job_id -> {"files": {url: Future}, "bytes": booked bytes}
+        self._bytes = 0
+        self._finished = deque(maxlen=1024)  # recently discarded jobs, never scheduled again
+        self._pool = None
+        self._started_pid = None
+        self.counters = {
+            "jobs": 0,
+            "files": 0,
+            "bytes": 0,
+            "claimed": 0,
+            "over_budget": 0,
+            "failed": 0,
+            "discarded": 0
+        }
+
+    def start(self, peek, get_urls):
+        """Start prefetching once per process.
+
+        Args:
+            peek: ``peek(n)`` returns ``(job_id, data)`` of the next ``n`` queued jobs per pool
+            get_urls: ``get_urls(data)`` returns the URLs a job will download
+        """
+        if PREFETCH_JOBS <= 0 or self._started_pid == os.getpid():
+            return
+        self._started_pid = os.getpid()
+        self._pool = ThreadPoolExecutor(max_workers=max(PREFETCH_WORKERS, 1), thread_name_prefix="prefetch")
+        threading.Thread(target=self._loop, args=(peek, get_urls), name="prefetch", daemon=True).start()
+        logger.info(f"Prefetch started in pid {os.getpid()}: {PREFETCH_JOBS} jobs per pool, "
+                    f"{PREFETCH_MAX_BYTES} byte budget")
+
+    def _loop(self, peek, get_urls):
+        while True:
+            try:
+                for job_id, data in peek(PREFETCH_JOBS):
+                    self._schedule(job_id, data, get_urls)
+            except Exception as e:
+                logger.error(f"Prefetch: scheduling failed - {e}")
+            time.sleep(PREFETCH_INTERVAL)
+
+    def _schedule(self, job_id, data, get_urls):
+        with self._lock:
+            if job_id in self._jobs or job_id in self._finished:
+                return
+            self._jobs[job_id] = {"files": {}, "bytes": 0}
+            self.counters["jobs"] += 1
+        for url in get_urls(data):
+            size = head_content_length(url)
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return  # started or cancelled in the meantime
+                if url in job["files"]:
+                    continue
+                if size is None or self._bytes + size > PREFETCH_MAX_BYTES:
+                    self.counters["over_budget"] += 1
+                    continue
+                self._bytes += size
+                job["bytes"] += size
+                job["files"][url] = self._pool.submit(self._fetch, job_id, url)
+
+    def _fetch(self, job_id, url):
+        from services.file_management import download_file
+        start_time = time.time()
+        try:
+            path = download_file(url, scratch.path_for(job_id))
+        except Exception as e:
+            with self._lock:
+                self.counters["failed"] += 1
+            logger.warning(f"Job {job_id}: prefetch of {url} failed - {e}")
+            raise
+        size = os.path.getsize(path)
+        with self._lock:
+            discarded = job_id not in self._jobs
+            if not discarded:
+                self.counters["files"] += 1
+                self.counters["bytes"] += size
+        if discarded:
+            # The job's directory may only have been created by this download
+            scratch.release(job_id)
+            return None
+        logger.info(f"Job {job_id}: prefetched {url} ({size} bytes) in {time.time() - start_time:.2f}s")
+        return path
+
+    def claim(self, job_id, url, storage_path):
+        """Path of ``url`` prefetched for ``job_id``, moved into ``storage_path``.
+
+        Returns None if it was not prefetched or the prefetch failed, in
+        which case the caller downloads it itself.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            future = job["files"].pop(url, None) if job else None
+        if future is None:
+            return None
+        while True:
+            try:
+                path = future.result(timeout=1.0)
+                break
+            except FutureTimeout:
+                raise_if_cancelled()
+            except Exception:
+                return None
+        if path is None:
+            return None
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(storage_path):
+            os.makedirs(storage_path, exist_ok=True)
+            target = os.path.join(storage_path, os.path.basename(path))
+            shutil.move(path, target)
+            path = target
+        with self._lock:
+            self.counters["claimed"] += 1
+        return register_temp_path(path)
+
+    def discard(self, job_id):
+        """Forget a finished or cancelled job and remove what it did not use."""
+        with self._lock:
+            self._finished.append(job_id)
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return
+            self._bytes -= job["bytes"]
+            unused = list(job["files"].values())
+            self.counters["discarded"] += len(unused)
+        for future in unused:
+            future.cancel()
+        scratch.release(job_id)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self.counters,
+                enabled=PREFETCH_JOBS > 0,
+                pending_jobs=len(self._jobs),
+                booked_bytes=self._bytes,
+                max_bytes=PREFETCH_MAX_BYTES
+            )
+
+
+prefetcher = Prefetcher()
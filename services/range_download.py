@@ -0,0 +1,214 @@
+# NCA-GPU-LEAN — Segmented, resumable HTTP downloads
+#
+# write_response() takes an open streaming GET response and writes its body to
+# a file with os.pwrite() and large buffers. When the server advertises
+# ``Accept-Ranges: bytes`` and a Content-Length of at least
+# RANGE_DOWNLOAD_MIN_BYTES, the file is preallocated and split into
+# RANGE_DOWNLOAD_SEGMENTS byte ranges fetched in parallel: the first range is
+# read from the response that is already open, the others with Range
+# requests pinned to the same entity by If-Range.
+#
+# Whenever ranges are supported, a segment that fails with a transient error
+# (connection reset, timeout, short read) resumes from its last written byte
+# instead of starting over. Servers without range support fall back to a
+# plain single stream. Every stream and segment is a flow of the bandwidth
+# scheduler (services/bandwidth.py).
+
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from services.http_client import http_client
+from services.job_control import raise_if_cancelled, current_job, attach
+from services.scratch import scratch
+from services.bandwidth import bandwidth
+
+logger = logging.getLogger(__name__)
+
+RANGE_DOWNLOAD_SEGMENTS = int(os.environ.get('RANGE_DOWNLOAD_SEGMENTS', 4))
+RANGE_DOWNLOAD_MIN_BYTES = int(os.environ.get('RANGE_DOWNLOAD_MIN_BYTES', 32 * 1024 ** 2))
+RANGE_DOWNLOAD_BUFFER = int(os.environ.get('RANGE_DOWNLOAD_BUFFER', 1024 ** 2))
+RANGE_DOWNLOAD_RETRIES = int(os.environ.get('RANGE_DOWNLOAD_RETRIES', 5))
+MIN_SEGMENT_BYTES = 8 * 1024 ** 2
+
+TRANSIENT_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class ShortRead(IOError):
+    """The connection ended before the requested range was complete."""
+
+
+def _range_support(response):
+    """Content length if the response can be fetched by byte ranges, else None."""
+    if response.headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return None
+    if response.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        return None  # Content-Length counts encoded bytes
+    try:
+        length = int(response.headers.get('Content-Length', ''))
+    except ValueError:
+        return None
+    return length if length > 0 else None
+
+
+def _validator(response):
+    """Strong ETag or Last-Modified for If-Range, so all ranges come from one version."""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
+
+
+def supports_ranges(url, timeout=None):
+    """True if ``url`` answers a one-byte Range request with 206 (i.e. it is seekable)."""
+    kwargs = {'timeout': timeout} if timeout else {}
+    try:
+        response = http_client.get(url, headers={'Range': 'bytes=0-0'}, stream=True, **kwargs)
+    except requests.RequestException:
+        return False
+    with response:
+        return response.status_code == 206
+
+
+def _fetch_range(url, fd, start, end, validator, response=None, failed=None, on_first_chunk=None, flow=None):
+    """Write bytes ``start``..``end`` (inclusive) of ``url`` to ``fd``, resuming on transient errors."""
+    offset = start
+    attempts = 0
+    while offset <= end:
+        try:
+            if response is None:
+                headers = {'Range': f'bytes={offset}-{end}'}
+                if validator:
+                    headers['If-Range'] = validator
+                response = http_client.get(url, headers=headers, stream=True)
+                if response.status_code != 206:
+                    response.close()
+                    raise ValueError(f"Range request for {url} returned {response.status_code}; "
+                                     f"the file changed or ranges are not supported")
+            with response:
+                for chunk in response.iter_content(chunk_size=RANGE_DOWNLOAD_BUFFER):
+                    if failed is not None and failed.is_set():
+                        return
+                    raise_if_cancelled()
+                    chunk = chunk[:end + 1 - offset]
+                    if flow:
+                        flow.consume(len(chunk))
+                    if offset == 0 and on_first_chunk:
+                        on_first_chunk(chunk)
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+                    if offset > end:
+                        break
+            response = None
+            if offset <= end:
+                raise ShortRead(f"connection closed at byte {offset} of {end + 1}")
+        except TRANSIENT_ERRORS + (ShortRead,) as e:
+            response = None
+            attempts += 1
+            if attempts > RANGE_DOWNLOAD_RETRIES:
+                raise
+            backoff = min(2 ** attempts, 30) * random.uniform(0.5, 1.0)
+            logger.warning(f"Download of {url} interrupted at byte {offset} ({e}), resuming in {backoff:.1f}s")
+            time.sleep(backoff)
+
+
+def _stream(response, fd, on_first_chunk=None, flow=None):
+    """Write a response that cannot be resumed, in large buffers."""
+    offset = 0
+    with response:
+        for chunk in response.iter_content(chunk_size=RANGE_DOWNLOAD_BUFFER):
+            if chunk:
+                raise_if_cancelled()
+                if flow:
+                    flow.consume(len(chunk))
+                if offset == 0 and on_first_chunk:
+                    on_first_chunk(chunk)
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+    return offset
+
+
+def _content_length(response):
+    if response.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+        return 0
+    try:
+        return max(int(response.headers.get('Content-Length', '')), 0)
+    except ValueError:
+        return 0
+
+
+def write_response(response, path, on_first_chunk=None):
+    """Write the body of an open ``stream=True`` GET response to ``path``.
+
+    The declared Content-Length is reserved in scratch space first, so a
+    download that cannot fit fails before writing anything.
+    ``on_first_chunk(data)`` is called with the first bytes of the body
+    before they are written; an exception raised by it aborts the download.
+
+    Returns:
+        int: number of bytes written
+
+    Raises:
+        ScratchSpaceError: if there is not enough free space for the file
+    """
+    size = _content_length(response)
+    with scratch.reserve(size, os.path.dirname(os.path.abspath(path))):
+        return _write_response(response, path, on_first_chunk, size or None)
+
+
+def _write_response(response, path, on_first_chunk, size):
+    url = response.url
+    length = _range_support(response)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if not length:
+            with bandwidth.transfer(url, size) as flow:
+                return _stream(response, fd, on_first_chunk, flow)
+
+        try:
+            os.posix_fallocate(fd, 0, length)
+        except OSError:
+            os.ftruncate(fd, length)
+        validator = _validator(response)
+
+        segments = 1
+        if length >= RANGE_DOWNLOAD_MIN_BYTES:
+            segments = max(1, min(RANGE_DOWNLOAD_SEGMENTS, length // MIN_SEGMENT_BYTES))
+        if segments == 1:
+            with bandwidth.transfer(url, length) as flow:
+                _fetch_range(url, fd, 0, length - 1, validator, response, on_first_chunk=on_first_chunk, flow=flow)
+            return length
+
+        bounds = [(length * i // segments, length * (i + 1) // segments - 1) for i in range(segments)]
+        failed = threading.Event()
+        job = current_job()
+
+        def fetch(index):
+            start, end = bounds[index]
+            with attach(job), bandwidth.transfer(url, length) as flow:
+                try:
+                    _fetch_range(url, fd, start, end, validator, response if index == 0 else None, failed,
+                                 on_first_chunk if index == 0 else None, flow)
+                except BaseException:
+                    failed.set()
+                    raise
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=segments, thread_name_prefix="range") as pool:
+            futures = [pool.submit(fetch, i) for i in range(segments)]
+            for future in futures:
+                future.result()
+        response.close()
+        elapsed = time.time() - start_time
+        logger.info(f"Downloaded {length} bytes in {segments} segments in {elapsed:.2f}s "
+                    f"({length / max(elapsed, 0.001) / 1024 ** 2:.1f} MB/s)")
+        return length
+    finally:
+        os.close(fd)
@@ -17,33 +17,89 @@
 
 
 import os
-import boto3
 import logging
+from botocore.exceptions import ClientError
+from services.storage_clients import storage_clients
+from services.multipart_upload import MultipartUpload
+from services.upload_dedup import upload_index
 from urllib.parse import urlparse, quote
 
 logger = logging.getLogger(__name__)
 
-def upload_to_s3(file_path, s3_url, access_key, secret_key, bucket_name, region):
+MAX_COPY_BYTES = 5 * 1024 ** 3  # larger objects need a multipart copy
+
+def upload_to_s3(file_path, s3_url, access_key, secret_key, bucket_name, region, keep_name=False):
     # Parse the S3 URL into bucket, region, and endpoint
     #bucket_name, region, endpoint_url = parse_s3_url(s3_url)
     
-    session = boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name=region
-    )
-    
-    client = session.client('s3', endpoint_url=s3_url)
+    client = storage_clients.s3(s3_url, access_key, secret_key, region)
 
-    try:
-        # Upload the file to the specified S3 bucket
+    def put(key, digest):
+        extra_args = {'ACL': 'public-read'}
+        if digest:
+            extra_args['Metadata'] = {'sha256': digest}
         with open(file_path, 'rb') as data:
-            client.upload_fileobj(data, bucket_name, os.path.basename(file_path), ExtraArgs={'ACL': 'public-read'})
+            client.upload_fileobj(data, bucket_name, key, ExtraArgs=extra_args)
+
+    def head(key):
+        try:
+            response = client.head_object(Bucket=bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return response.get('Metadata', {}).get('sha256', '')
+
+    def copy(source_key, key):
+        if os.path.getsize(file_path) > MAX_COPY_BYTES:
+            raise ValueError("object too large for a single-request copy")
+        client.copy_object(
+            Bucket=bucket_name,
+            Key=key,
+            CopySource={'Bucket': bucket_name, 'Key': source_key},
+            MetadataDirective='COPY',
+            ACL='public-read'
+        )
+
+    try:
+        # Upload the file to the specified S3 bucket (or reuse an identical object)
+        key = upload_index.upload(file_path, f"s3:{s3_url}/{bucket_name}", put, head, copy, keep_name)
 
         # URL encode the filename for the URL
-        encoded_filename = quote(os.path.basename(file_path))
+        encoded_filename = quote(key)
         file_url = f"{s3_url}/{bucket_name}/{encoded_filename}"
         return file_url
     except Exception as e:
         logger.error(f"Error uploading file to S3: {e}")
         raise
+
+
+class S3StreamUpload:
+    """Upload of data that is still being produced, as a public-read multipart upload.
+
+    ``write()`` the data, then ``finish()`` returns the file URL; ``abort()``
+    (or leaving the ``with`` block without finishing) discards the parts.
+    """
+
+    def __init__(self, filename, s3_url, access_key, secret_key, bucket_name, region):
+        client = storage_clients.s3(s3_url, access_key, secret_key, region)
+        self.url = f"{s3_url}/{bucket_name}/{quote(filename)}"
+        self.stats = None
+        self._upload = MultipartUpload(client, bucket_name, filename, ACL='public-read')
+
+    def __enter__(self):
+        self._upload.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._upload.__exit__(exc_type, exc, tb)
+
+    def write(self, data):
+        self._upload.write(data)
+
+    def finish(self):
+        self.stats = self._upload.complete()
+        return self.url
+
+    def abort(self):
+        self._upload.abort()
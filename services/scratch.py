@@ -0,0 +1,196 @@
+# NCA-GPU-LEAN — Per-job scratch space
+#
+# Each job gets its own directory, SCRATCH_DIR/<job_id>.<owner>, for inputs,
+# intermediates and outputs (<owner> is the worker's process_token(), so a
+# restarted container that reuses pids still tells old directories apart).
+# The directory is removed when the job's context ends (success, error,
+# cancel or timeout), so a failing service can no longer leak files into
+# LOCAL_STORAGE_PATH. Directories left behind by worker processes that died
+# are swept at startup.
+#
+# Downloads reserve their Content-Length before writing. A reservation fails
+# with ScratchSpaceError when the free space, minus SCRATCH_HEADROOM_BYTES and
+# minus the bytes other in-flight downloads of this process have reserved,
+# cannot hold it. The job then fails at once instead of filling the disk
+# for every job.
+#
+# Small intermediates (thumbnails, ASS files, concat lists) can go to a
+# second, RAM-backed tier under SCRATCH_RAM_DIR (/dev/shm by default) via
+# job_scratch_path(). A file goes there only when its expected size is at
+# most SCRATCH_RAM_FILE_MAX_BYTES and the tier, shared by all workers, stays
+# under SCRATCH_RAM_MAX_BYTES; otherwise it spills to the disk tier. Set
+# SCRATCH_RAM_DIR to an empty string to disable the RAM tier.
+
+import os
+import uuid
+import errno
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from config import LOCAL_STORAGE_PATH
+from services.job_control import current_job
+from services.job_journal import process_token, owner_alive
+
+logger = logging.getLogger(__name__)
+
+SCRATCH_DIR = os.environ.get('SCRATCH_DIR', os.path.join(LOCAL_STORAGE_PATH, 'scratch'))
+SCRATCH_HEADROOM_BYTES = int(os.environ.get('SCRATCH_HEADROOM_BYTES', 512 * 1024 ** 2))
+SCRATCH_RAM_DIR = os.environ.get(
+    'SCRATCH_RAM_DIR', '/dev/shm/nca-scratch' if os.path.isdir('/dev/shm') else ''
+)
+SCRATCH_RAM_MAX_BYTES = int(os.environ.get('SCRATCH_RAM_MAX_BYTES', 256 * 1024 ** 2))
+SCRATCH_RAM_FILE_MAX_BYTES = int(os.environ.get('SCRATCH_RAM_FILE_MAX_BYTES', 8 * 1024 ** 2))
+
+
+class ScratchSpaceError(OSError):
+    """Not enough scratch space for a download."""
+
+    def __init__(self, message):
+        super().__init__(errno.ENOSPC, message)
+
+
+class ScratchManager:
+    def __init__(self, root=SCRATCH_DIR, max_bytes=None, headroom=SCRATCH_HEADROOM_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.headroom = headroom
+        self._lock = threading.Lock()
+        self._reserved = 0
+        self._dirs = {}  # job_id -> directory
+
+    def job_dir(self):
+        """Scratch directory of the current job, created on first use.
+
+        Outside a job (e.g. a direct call from a script) a one-off directory is
+        returned that is only removed by the orphan sweep.
+        """
+        ctx = current_job()
+        job_id = ctx.job_id if ctx else f"nojob-{uuid.uuid4()}"
+        with self._lock:
+            path = self._dirs.get(job_id)
+            if path:
+                return path
+            path = self.path_for(job_id)
+            os.makedirs(path, exist_ok=True)
+            if ctx:
+                self._dirs[job_id] = path
+                ctx.add_cleanup(lambda: self.release(job_id))
+        return path
+
+    def path_for(self, job_id):
+        """Directory of ``job_id`` in this process (also used before the job starts)."""
+        return os.path.join(self.root, f"{job_id}.{process_token()}")
+
+    def release(self, job_id):
+        """Remove a job's directory and everything in it."""
+        with self._lock:
+            path = self._dirs.pop(job_id, None) or self.path_for(job_id)
+        shutil.rmtree(path, ignore_errors=True)
+
+    @contextmanager
+    def reserve(self, nbytes, path=None):
+        """Hold ``nbytes`` of scratch space while the enclosed write runs.
+
+        Raises:
+            ScratchSpaceError: if the space is not available
+        """
+        path = path or self.root
+        os.makedirs(self.root, exist_ok=True)
+        free = shutil.disk_usage(path).free - self.headroom
+        with self._lock:
+            if nbytes > free - self._reserved:
+                raise ScratchSpaceError(
+                    f"Insufficient scratch space: need {nbytes} bytes, "
+                    f"{max(free - self._reserved, 0)} available on {path}"
+                )
+            self._reserved += nbytes
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._reserved -= nbytes
+
+    def usage(self):
+        """Bytes currently stored under the root, by all worker processes."""
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_size
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def has_room(self, nbytes):
+        """True if a file of ``nbytes`` fits without exceeding max_bytes or the free space."""
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            free = shutil.disk_usage(self.root).free - self.headroom
+        except OSError:
+            return False
+        with self._lock:
+            free -= self._reserved
+        if nbytes > free:
+            return False
+        return self.max_bytes is None or self.usage() + nbytes <= self.max_bytes
+
+    def sweep_orphans(self):
+        """Remove job directories whose worker process is gone."""
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        for name in os.listdir(self.root):
+            owner = name.rsplit('.', 1)[-1]
+            if not owner.split('-', 1)[0].isdigit() or owner_alive(owner):
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            removed += 1
+        if removed:
+            logger.info(f"Scratch: removed {removed} orphaned job director{'y' if removed == 1 else 'ies'}")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            active, reserved = len(self._dirs), self._reserved
+        usage = shutil.disk_usage(self.root) if os.path.isdir(self.root) else None
+        stats = {
+            "root": self.root,
+            "active_jobs": active,
+            "reserved_bytes": reserved,
+            "free_bytes": usage.free if usage else None
+        }
+        if self.max_bytes is not None:
+            stats["used_bytes"] = self.usage()
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+scratch = ScratchManager()
+ram_scratch = ScratchManager(SCRATCH_RAM_DIR, SCRATCH_RAM_MAX_BYTES, headroom=0) if SCRATCH_RAM_DIR else None
+
+
+def job_scratch_dir():
+    """Scratch directory of the current job (see ScratchManager.job_dir)."""
+    return scratch.job_dir()
+
+
+def job_scratch_path(filename, expected_bytes=SCRATCH_RAM_FILE_MAX_BYTES):
+    """Path for a small intermediate file of the current job.
+
+    The file is placed in the RAM tier when ``expected_bytes`` is within
+    SCRATCH_RAM_FILE_MAX_BYTES and the tier has room, otherwise in the job's
+    disk scratch directory. Both are removed when the job ends.
+    """
+    if ram_scratch and expected_bytes <= SCRATCH_RAM_FILE_MAX_BYTES and ram_scratch.has_room(expected_bytes):
+        return os.path.join(ram_scratch.job_dir(), filename)
+    return os.path.join(scratch.job_dir(), filename)
+
+
+def sweep_scratch_orphans():
+    """Remove orphaned job directories from every scratch tier."""
+    return sum(tier.sweep_orphans() for tier in (scratch, ram_scratch) if tier)
+
+
+def scratch_stats():
+    return dict(scratch.stats(), ram=ram_scratch.stats() if ram_scratch else None)
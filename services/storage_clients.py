@@ -0,0 +1,123 @@
+# NCA-GPU-LEAN — Long-lived storage clients
+#
+# boto3 sessions/clients and google-cloud-storage clients are expensive to
+# build (credential parsing, endpoint resolution, tens of milliseconds of
+# CPU) and each new client starts with a cold connection pool, i.e. a fresh
+# TLS handshake per upload. StorageClients builds every client once per
+# worker process, on first use or in warm() right after the worker forks, and
+# hands the same thread-safe client to every upload afterwards.
+#
+# The construction time of each client is logged and reported by stats().
+
+import os
+import json
+import time
+import logging
+import threading
+import boto3
+from botocore.config import Config
+from google.cloud import storage
+from google.oauth2 import service_account
+
+logger = logging.getLogger(__name__)
+
+# Connections each S3 client keeps open (boto3's default of 10 throttles parallel part uploads)
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 32))
+GCS_SCOPES = ['https://www.googleapis.com/auth/devstorage.full_control']
+
+
+def _build_s3_client(endpoint_url, access_key, secret_key, region):
+    session = boto3.Session(
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name=region
+    )
+    return session.client('s3', endpoint_url=endpoint_url, config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS))
+
+
+def _build_gcs_client(credentials_json):
+    try:
+        credentials_info = json.loads(credentials_json)
+    except json.JSONDecodeError:
+        raise ValueError("GCP_SA_CREDENTIALS is not valid JSON")
+    try:
+        credentials = service_account.Credentials.from_service_account_info(credentials_info, scopes=GCS_SCOPES)
+        return storage.Client(credentials=credentials)
+    except Exception as e:
+        raise ValueError(f"Failed to create GCS client: {str(e)}")
+
+
+class StorageClients:
+    """Per-process registry of storage clients, keyed by their configuration."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._clients = {}
+        self._build_seconds = {}
+
+    def _get(self, key, factory, *args):
+        if self._pid != os.getpid():
+            # Clients (and their sockets) must not be shared across fork()
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._clients = {}
+                    self._build_seconds = {}
+                    self._pid = os.getpid()
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                start = time.perf_counter()
+                client = factory(*args)
+                elapsed = time.perf_counter() - start
+                self._clients[key] = client
+                self._build_seconds[key[0]] = round(elapsed, 4)
+                logger.info(f"Storage: built {key[0]} client in {elapsed * 1000:.1f} ms (pid {os.getpid()})")
+        return client
+
+    def s3(self, endpoint_url=None, access_key=None, secret_key=None, region=None):
+        """S3 client for the given settings (defaults: the S3_* environment variables)."""
+        endpoint_url = endpoint_url or os.getenv('S3_ENDPOINT_URL')
+        access_key = access_key or os.getenv('S3_ACCESS_KEY')
+        secret_key = secret_key or os.getenv('S3_SECRET_KEY')
+        region = region if region is not None else os.environ.get('S3_REGION', '')
+        key = ('s3', endpoint_url, access_key, secret_key, region)
+        return self._get(key, _build_s3_client, endpoint_url, access_key, secret_key, region)
+
+    def gcs(self):
+        """GCS client for GCP_SA_CREDENTIALS.
+
+        Raises:
+            ValueError: if the credentials are missing or invalid, or the client cannot be created
+        """
+        credentials_json = os.environ.get('GCP_SA_CREDENTIALS')
+        if not credentials_json:
+            raise ValueError("GCP_SA_CREDENTIALS environment variable is not set")
+        return self._get(('gcs', credentials_json), _build_gcs_client, credentials_json)
+
+    def warm(self):
+        """Build the clients of the configured providers now instead of on the first upload."""
+        builders = []
+        if os.getenv('S3_ENDPOINT_URL'):
+            builders.append(('s3', self.s3))
+        if os.getenv('GCP_SA_CREDENTIALS'):
+            builders.append(('gcs', self.gcs))
+        for name, build in builders:
+            try:
+                build()
+            except Exception as e:
+                logger.error(f"Storage: could not build {name} client - {e}")
+        return self.stats()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "clients": sorted(key[0] for key in self._clients) if self._pid == os.getpid() else [],
+                "build_seconds": dict(self._build_seconds) if self._pid == os.getpid() else {}
+            }
+
+
+storage_clients = StorageClients()
@@ -0,0 +1,206 @@
+# NCA-GPU-LEAN — Upload deduplication
+#
+# Re-rendering an identical job produces byte-identical outputs, and uploading
+# them again costs the full transfer. Every uploaded file of at least
+# UPLOAD_DEDUP_MIN_BYTES is hashed (SHA-256) and recorded in an SQLite index
+# (LOCAL_STORAGE_PATH/jobs/uploads.db) together with the bucket and key it was
+# stored under; the hash is also stored as object metadata ("sha256").
+#
+# When the same content is uploaded again:
+#
+#   - same key: a HEAD request confirms the object still holds that content
+#     and the upload is skipped;
+#   - other key: the object is copied server-side from a key that holds it
+#     (S3 CopyObject / GCS rewrite), without sending the bytes again.
+#
+# With UPLOAD_CONTENT_ADDRESSED_KEYS the object key is derived from the hash
+# (<sha256><ext>), so identical outputs share one object and one URL; the
+# HEAD check then also finds objects uploaded by other containers. Files
+# that others refer to by name (HLS segments and playlists) are uploaded with
+# keep_name and keep their basename as key.
+#
+# Index entries are only hints: a missing or changed object falls back to a
+# regular upload and the stale entry is dropped.
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from config import LOCAL_STORAGE_PATH
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DEDUP_ENABLED = os.environ.get('UPLOAD_DEDUP', 'true').lower() in ['true', '1']
+UPLOAD_DEDUP_PATH = os.environ.get('UPLOAD_DEDUP_PATH', os.path.join(LOCAL_STORAGE_PATH, 'jobs', 'uploads.db'))
+# Below this size a HEAD/copy round trip saves next to nothing over uploading
+UPLOAD_DEDUP_MIN_BYTES = int(os.environ.get('UPLOAD_DEDUP_MIN_BYTES', 1024 ** 2))
+UPLOAD_DEDUP_TTL = float(os.environ.get('UPLOAD_DEDUP_TTL', 30 * 86400))  # seconds an entry is trusted
+UPLOAD_CONTENT_ADDRESSED_KEYS = os.environ.get('UPLOAD_CONTENT_ADDRESSED_KEYS', 'false').lower() in ['true', '1']
+HASH_CHUNK_BYTES = 1024 ** 2
+MAX_COPY_SOURCES = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploaded_objects (
+    store TEXT NOT NULL,
+    object_key TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (store, object_key)
+)
+"""
+INDEX = "CREATE INDEX IF NOT EXISTS uploaded_objects_sha256 ON uploaded_objects (store, sha256)"
+
+
+def content_hash(file_path):
+    """SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_key(filename, digest):
+    """Content-addressed object key for ``filename`` with hash ``digest``."""
+    return digest + os.path.splitext(filename)[1].lower()
+
+
+class UploadIndex:
+    """Index of uploaded objects by content hash, shared by the workers of a container."""
+
+    def __init__(self, path=UPLOAD_DEDUP_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+        self.counters = {
+            "hashed": 0,
+            "hash_seconds": 0.0,
+            "uploaded": 0,
+            "skipped": 0,
+            "copied": 0,
+            "stale": 0,
+            "bytes_saved": 0
+        }
+
+    def _db(self):
+        # Connections do not survive fork(); open one per process.
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            conn.execute(INDEX)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def lookup(self, store, digest, size):
+        """Keys in ``store`` recorded with this content, most recent first."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT object_key FROM uploaded_objects WHERE store=? AND sha256=? AND size=? AND uploaded_at>? "
+                "ORDER BY uploaded_at DESC LIMIT ?",
+                (store, digest, size, time.time() - UPLOAD_DEDUP_TTL, MAX_COPY_SOURCES)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def record(self, store, key, digest, size):
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO uploaded_objects (store, object_key, sha256, size, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (store, key, digest, size, time.time())
+            )
+
+    def forget(self, store, key):
+        with self._lock:
+            self._db().execute("DELETE FROM uploaded_objects WHERE store=? AND object_key=?", (store, key))
+            self.counters["stale"] += 1
+
+    def upload(self, file_path, store, put, head, copy, keep_name=False):
+        """Upload ``file_path`` to ``store``, reusing an identical stored object when possible.
+
+        Args:
+            file_path: Local file to upload
+            store: Identifies the bucket (e.g. "s3:<endpoint>/<bucket>")
+            put: ``put(key, digest)`` uploads the file under ``key``; ``digest`` is
+                None when the file is not hashed, else stored as metadata
+            head: ``head(key)`` returns the sha256 metadata of the object at
+                ``key`` ("" if it has none), or None if it does not exist
+            copy: ``copy(source_key, key)`` copies an object server-side
+            keep_name: Store under the file's basename even with content-addressed keys
+
+        Returns:
+            str: The object key the file is stored under
+        """
+        key = os.path.basename(file_path)
+        size = os.path.getsize(file_path)
+        if not UPLOAD_DEDUP_ENABLED or size < UPLOAD_DEDUP_MIN_BYTES:
+            put(key, None)
+            return key
+
+        start = time.perf_counter()
+        digest = content_hash(file_path)
+        self._count("hashed")
+        self._count("hash_seconds", time.perf_counter() - start)
+        content_addressed = UPLOAD_CONTENT_ADDRESSED_KEYS and not keep_name
+        if content_addressed:
+            key = content_key(key, digest)
+
+        sources = self.lookup(store, digest, size)
+        # Without an index entry the key can only hold this content if it is content-addressed
+        if key in sources or content_addressed:
+            try:
+                stored = head(key)
+            except Exception as e:
+                logger.warning(f"Upload dedup: HEAD of {key} failed - {e}")
+                stored = None
+            if stored == digest:
+                self.record(store, key, digest, size)
+                self._count("skipped")
+                self._count("bytes_saved", size)
+                logger.info(f"Upload dedup: {key} already stored, skipped {size} bytes")
+                return key
+            if key in sources:
+                self.forget(store, key)
+
+        for source in sources:
+            if source == key:
+                continue
+            try:
+                copy(source, key)
+            except Exception as e:
+                logger.warning(f"Upload dedup: copy of {source} to {key} failed - {e}")
+                self.forget(store, source)
+                continue
+            self.record(store, key, digest, size)
+            self._count("copied")
+            self._count("bytes_saved", size)
+            logger.info(f"Upload dedup: copied {source} to {key} server-side, skipped {size} bytes")
+            return key
+
+        put(key, digest)
+        self.record(store, key, digest, size)
+        self._count("uploaded")
+        return key
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters, hash_seconds=round(self.counters["hash_seconds"], 3))
+        return dict(
+            counters,
+            enabled=UPLOAD_DEDUP_ENABLED,
+            content_addressed_keys=UPLOAD_CONTENT_ADDRESSED_KEYS,
+            min_bytes=UPLOAD_DEDUP_MIN_BYTES
+        )
+
+
+upload_index = UploadIndex()
@@ -19,6 +19,7 @@
 import os
 import ffmpeg
 from services.file_management import download_file
+from services.scratch import job_scratch_path
 from config import LOCAL_STORAGE_PATH
 
 def process_audio_concatenate(media_urls, job_id, webhook_url=None):
@@ -35,7 +36,7 @@ def process_audio_concatenate(media_urls, job_id, webhook_url=None):
             input_files.append(input_filename)
 
         # Generate an absolute path concat list file for FFmpeg
-        concat_file_path = os.path.join(LOCAL_STORAGE_PATH, f"{job_id}_concat_list.txt")
+        concat_file_path = job_scratch_path(f"{job_id}_concat_list.txt")
         with open(concat_file_path, 'w') as concat_file:
             for input_file in input_files:
                 # Write absolute paths to the concat list
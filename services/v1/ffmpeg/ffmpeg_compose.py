@@ -20,10 +20,35 @@ import os
 import subprocess
 import json
 import re
-from services.file_management import download_file
-from config import LOCAL_STORAGE_PATH
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from services.file_management import download_files
+from services.job_control import run_process, register_temp_path, raise_if_cancelled, record_stat
+from services.ffmpeg_progress import FFmpegProgress, PROGRESS_ARGS
+from services.range_download import supports_ranges
+from services.scratch import job_scratch_dir, job_scratch_path
+from services.encode_upload import open_output_upload
 import os
 
+# "auto": stream HTTP(S) inputs that are only partly read (-ss/-t/-to) from
+# servers that support Range requests; "off": only inputs with "stream": true
+COMPOSE_STREAM_INPUTS = os.environ.get('COMPOSE_STREAM_INPUTS', 'auto').lower()
+PARTIAL_READ_OPTIONS = {'-ss', '-sseof', '-t', '-to'}
+# Longest the Range probes of a job may hold up its submission (unanswered: download)
+COMPOSE_STREAM_PROBE_TIMEOUT = float(os.environ.get('COMPOSE_STREAM_PROBE_TIMEOUT', 2))
+# Input options that let ffmpeg survive dropped connections while streaming
+STREAM_INPUT_OPTIONS = [
+    '-reconnect', '1',
+    '-reconnect_streamed', '1',
+    '-reconnect_on_network_error', '1',
+    '-reconnect_delay_max', '10',
+    '-rw_timeout', '30000000'
+]
+# subtitles=/ass= filter arguments that reference a remote file
+SUBTITLE_PATTERN = r"(.*?)(subtitles|ass)=([\'\"])(https?://[^'\"]+)([\'\"])(.*)"
+# Upper bound for a single-frame JPEG thumbnail (a 4K frame stays well below)
+THUMBNAIL_EXPECTED_BYTES = 2 * 1024 ** 2
+
 def is_gpu_available():
     return os.path.exists('/dev/nvidia0')
 
@@ -46,14 +71,18 @@ def get_extension_from_format(format_name):
         'wav': 'wav',
         'aac': 'aac',
         'flac': 'flac',
-        'ogg': 'ogg'
+        'ogg': 'ogg',
+        'matroska': 'mkv',
+        'mpegts': 'ts',
+        'hls': 'm3u8'
     }
     return format_to_extension.get(format_name.lower(), 'mp4')  # Default to mp4 if unknown
 
 def get_metadata(filename, metadata_requests, job_id):
     metadata = {}
     if metadata_requests.get('thumbnail'):
-        thumbnail_filename = f"{os.path.splitext(filename)[0]}_thumbnail.jpg"
+        thumbnail_filename = job_scratch_path(f"{os.path.splitext(os.path.basename(filename))[0]}_thumbnail.jpg",
+                                              THUMBNAIL_EXPECTED_BYTES)
         thumbnail_command = [
             'ffmpeg',
             '-i', filename,
@@ -61,8 +90,9 @@ def get_metadata(filename, metadata_requests, job_id):
             '-vframes', '1',
             thumbnail_filename
         ]
+        register_temp_path(thumbnail_filename)
         try:
-            subprocess.run(thumbnail_command, check=True, capture_output=True, text=True)
+            run_process(thumbnail_command, check=True)
             if os.path.exists(thumbnail_filename):
                 metadata['thumbnail'] = thumbnail_filename  # Return local path instead of URL
         except subprocess.CalledProcessError as e:
@@ -80,7 +110,7 @@ def get_metadata(filename, metadata_requests, job_id):
             '-show_streams',
             filename
         ]
-        result = subprocess.run(ffprobe_command, capture_output=True, text=True)
+        result = run_process(ffprobe_command)
         probe_data = json.loads(result.stdout)
         
         if metadata_requests.get('duration'):
@@ -98,8 +128,75 @@ def get_metadata(filename, metadata_requests, job_id):
 
     return metadata
 
+def should_stream_input(input_data):
+    """Whether ffmpeg should read an input straight from its URL instead of a local copy."""
+    file_url = input_data["file_url"]
+    if not file_url.lower().startswith(('http://', 'https://')):
+        return False
+    if "stream" in input_data:
+        return bool(input_data["stream"])
+    return _reads_partially(input_data) and supports_ranges(file_url)
+
+def _reads_partially(input_data):
+    """Whether "auto" mode would stream this input, if its server supports Range requests."""
+    if COMPOSE_STREAM_INPUTS != 'auto' or "stream" in input_data:
+        return False
+    if not str(input_data.get("file_url", "")).lower().startswith(('http://', 'https://')):
+        return False
+    options = {option["option"] for option in input_data.get("options", [])}
+    return bool(options & PARTIAL_READ_OPTIONS)
+
+def resolve_stream_inputs(data):
+    """Decide once, when the job is submitted, which inputs ffmpeg streams.
+
+    Probes the candidate inputs of "auto" mode concurrently (at most
+    COMPOSE_STREAM_PROBE_TIMEOUT seconds in total) and records the outcome
+    as their ``"stream"`` flag. Admission, prefetch and the job itself (also
+    after a journal replay) then follow the same plan without probing again.
+    """
+    candidates = [input_data for input_data in data.get("inputs", []) if _reads_partially(input_data)]
+    if not candidates:
+        return
+    pool = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix="range-probe")
+    futures = [pool.submit(supports_ranges, input_data["file_url"], COMPOSE_STREAM_PROBE_TIMEOUT)
+               for input_data in candidates]
+    wait(futures, timeout=COMPOSE_STREAM_PROBE_TIMEOUT)
+    pool.shutdown(wait=False)
+    for input_data, future in zip(candidates, futures):
+        input_data["stream"] = future.done() and not future.exception() and future.result()
+
+def get_fetch_plan(data):
+    """Split the inputs of a compose payload into streamed and downloaded URLs.
+
+    Returns:
+        tuple: (set of input URLs ffmpeg reads over HTTP, list of input and
+        subtitle/ASS URLs to download)
+    """
+    streamed = {input_data["file_url"] for input_data in data["inputs"] if should_stream_input(input_data)}
+    subtitle_urls = []
+    for filter_obj in data.get("filters") or []:
+        for match in re.finditer(SUBTITLE_PATTERN, filter_obj["filter"]):
+            if match.group(4).strip():
+                subtitle_urls.append(match.group(4))
+    downloads = [input_data["file_url"] for input_data in data["inputs"] if input_data["file_url"] not in streamed]
+    return streamed, list(dict.fromkeys(downloads + subtitle_urls))
+
+def get_prefetch_urls(data):
+    """URLs a queued compose job will download (streamed inputs are skipped)."""
+    if not isinstance(data.get("inputs"), list):
+        return []
+    return get_fetch_plan(data)[1]
+
 def process_ffmpeg_compose(data, job_id):
+    """Run a compose job.
+
+    Returns:
+        tuple: (output file paths, per-output metadata, {output index: URL}
+        for outputs already uploaded while encoding)
+    """
     output_filenames = []
+    output_uploads = {}
+    work_dir = job_scratch_dir()
     
     # Build FFmpeg command
     command = ["ffmpeg"]
@@ -110,21 +207,33 @@ def process_ffmpeg_compose(data, job_id):
         if "argument" in option and option["argument"] is not None:
             command.append(str(option["argument"]))
     
+    # Fetch every distinct input and subtitle/ASS URL concurrently, except
+    # inputs that ffmpeg reads directly over HTTP
+    streamed, fetch_urls = get_fetch_plan(data)
+    fetch_start = time.time()
+    downloads = download_files(fetch_urls, work_dir)
+    record_stat("fetch", {
+        "seconds": round(time.time() - fetch_start, 3),
+        "inputs": [
+            {"url": url, "seconds": result["seconds"], "bytes": result["bytes"], "prefetched": result["prefetched"]}
+            for url, result in downloads.items()
+        ],
+        "streamed": sorted(streamed)
+    })
+
     # Add inputs
     input_paths = []
-    download_cache = {}  # cache of url -> local_path
     for input_data in data["inputs"]:
         if "options" in input_data:
             for option in input_data["options"]:
                 command.append(option["option"])
                 if "argument" in option and option["argument"] is not None:
                     command.append(str(option["argument"]))
-        file_url = input_data["file_url"]
-        if file_url in download_cache:
-            input_path = download_cache[file_url]
-        else:
-            input_path = download_file(file_url, LOCAL_STORAGE_PATH)
-            download_cache[file_url] = input_path
+        if input_data["file_url"] in streamed:
+            command.extend(STREAM_INPUT_OPTIONS)
+            command.extend(["-i", input_data["file_url"]])
+            continue
+        input_path = downloads[input_data["file_url"]]["path"]
         input_paths.append(input_path)
         command.extend(["-i", input_path])
     
@@ -145,13 +254,12 @@ def process_ffmpeg_compose(data, job_id):
                     print(f"[DEBUG] Skipping empty URL for filter: {match.group(0)}")
                     return match.group(0)
                 print(f"[DEBUG] Parsed URL for filter: {url}")
-                local_path = download_file(url, LOCAL_STORAGE_PATH)
+                local_path = downloads[url]["path"]
                 subtitles_paths.append(local_path)
                 fixed_path = local_path.replace('\\', '/')
                 return f"{prefix}{filter_type}={quote}{fixed_path}{closing_quote}{trailing}"
             # Regex: (.*?)(subtitles|ass)=(['"])(https?://[^'\"]+)(['"])(.*)
-            pattern = r"(.*?)(subtitles|ass)=([\'\"])(https?://[^'\"]+)([\'\"])(.*)"
-            filter_str = re.sub(pattern, replace_url, filter_str)
+            filter_str = re.sub(SUBTITLE_PATTERN, replace_url, filter_str)
             new_filters.append(filter_str)
         filter_complex = ";".join(new_filters)
         command.extend(["-filter_complex", filter_complex])
@@ -172,20 +280,50 @@ def process_ffmpeg_compose(data, job_id):
         if extension in ['mp4', 'mkv', 'mov'] and not has_video_encoder and is_gpu_available():
             command.extend(['-c:v', 'h264_nvenc'])
             
-        output_filename = os.path.join(LOCAL_STORAGE_PATH, f"{job_id}_output_{i}.{extension}")
-        output_filenames.append(output_filename)
+        output_filename = os.path.join(work_dir, f"{job_id}_output_{i}.{extension}")
+        output_filenames.append(register_temp_path(output_filename))
         
         for option in output["options"]:
             command.append(option["option"])
             if "argument" in option and option["argument"] is not None:
                 command.append(str(option["argument"]))
-        command.append(output_filename)
+        if output.get("stream_upload"):
+            # Upload while encoding: ffmpeg writes to the uploader's target instead
+            output_upload = open_output_upload(output_filename, extension, output["options"])
+            output_uploads[i] = output_upload
+            command.extend(output_upload.options)
+            command.append(output_upload.target)
+        else:
+            command.append(output_filename)
     
-    # Execute FFmpeg command
+    # Execute FFmpeg command (in its own process group, killed on cancel/deadline)
+    # and stream its -progress output into the job record
+    raise_if_cancelled()
+    command[1:1] = PROGRESS_ARGS
+    if output_uploads and "-y" not in command:
+        command.insert(1, "-y")  # the FIFOs already exist
+    progress = FFmpegProgress(job_id, data.get("progress_webhook_url"))
+    uploaded_urls = {}
     try:
-        subprocess.run(command, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
-        raise Exception(f"FFmpeg command failed: {e.stderr}")
+        for output_upload in output_uploads.values():
+            output_upload.start()
+        try:
+            run_process(command, check=True, on_stdout_line=progress.feed)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"FFmpeg command failed: {e.stderr}")
+        finally:
+            record_stat("encode", progress.summary())
+            for output_upload in output_uploads.values():
+                output_upload.stop()
+        for i, output_upload in output_uploads.items():
+            uploaded_urls[i] = output_upload.finish()
+    except BaseException:
+        for i, output_upload in output_uploads.items():
+            if i not in uploaded_urls:
+                output_upload.abort()
+        raise
+    if output_uploads:
+        record_stat("stream_upload", {str(i): output_upload.stats() for i, output_upload in output_uploads.items()})
     
     # Clean up input files
     for input_path in input_paths:
@@ -201,4 +339,4 @@ def process_ffmpeg_compose(data, job_id):
         for output_filename in output_filenames:
             metadata.append(get_metadata(output_filename, data["metadata"], job_id))
     
-    return output_filenames, metadata
+    return output_filenames, metadata, uploaded_urls
@@ -16,33 +16,16 @@
 
 import os
 import logging
-import requests
-import json
-from google.cloud import storage
-from google.oauth2 import service_account
+from services.http_client import http_client
+from services.storage_clients import storage_clients
 from urllib.parse import urlparse, unquote
 import uuid
 
 logger = logging.getLogger(__name__)
 
 def get_gcs_client():
-    """Create and return a Google Cloud Storage client using service account credentials."""
-    credentials_json = os.environ.get('GCP_SA_CREDENTIALS')
-    if not credentials_json:
-        raise ValueError("GCP_SA_CREDENTIALS environment variable is not set")
-    
-    try:
-        # Parse the JSON credentials
-        credentials_info = json.loads(credentials_json)
-        credentials = service_account.Credentials.from_service_account_info(
-            credentials_info,
-            scopes=['https://www.googleapis.com/auth/devstorage.full_control']
-        )
-        return storage.Client(credentials=credentials)
-    except json.JSONDecodeError:
-        raise ValueError("GCP_SA_CREDENTIALS is not valid JSON")
-    except Exception as e:
-        raise ValueError(f"Failed to create GCS client: {str(e)}")
+    """Return this worker's Google Cloud Storage client for GCP_SA_CREDENTIALS."""
+    return storage_clients.gcs()
 
 def get_filename_from_url(url):
     """Extract filename from URL."""
@@ -76,7 +59,7 @@ def stream_upload_to_gcs(file_url, custom_filename=None, make_public=False, down
         blob = bucket.blob(filename)
 
         # Stream the file from URL
-        response = requests.get(file_url, stream=True, headers=download_headers)
+        response = http_client.get(file_url, stream=True, headers=download_headers)
         response.raise_for_status()
 
         # Get content type from response headers
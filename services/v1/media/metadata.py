@@ -20,7 +20,7 @@ import os
 import subprocess
 import json
 import logging
-import requests
+from services.http_client import http_client
 from config import LOCAL_STORAGE_PATH
 
 # Set up logging
@@ -47,7 +47,7 @@ def get_media_metadata(media_url, job_id=None):
 
         # Get file size from HTTP HEAD request (without downloading)
         try:
-            head_response = requests.head(media_url, allow_redirects=True, timeout=10)
+            head_response = http_client.head(media_url, allow_redirects=True, timeout=10)
             if 'content-length' in head_response.headers:
                 metadata['filesize'] = int(head_response.headers['content-length'])
                 metadata['filesize_mb'] = round(metadata['filesize'] / (1024 * 1024), 2)  # Convert to MB
@@ -17,9 +17,12 @@
 
 
 import os
-import boto3
 import logging
-import requests
+from services.storage_clients import storage_clients
+from services.http_client import http_client
+from services.bandwidth import bandwidth
+from services.multipart_upload import MultipartUpload
+from services.job_control import record_stat
 from urllib.parse import urlparse, unquote, quote
 import uuid
 import re
@@ -27,19 +30,8 @@ import re
 logger = logging.getLogger(__name__)
 
 def get_s3_client():
-    """Create and return an S3 client using environment variables."""
-    endpoint_url = os.getenv('S3_ENDPOINT_URL')
-    access_key = os.getenv('S3_ACCESS_KEY')
-    secret_key = os.getenv('S3_SECRET_KEY')
-    region = os.environ.get('S3_REGION', '')
-    
-    session = boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name=region
-    )
-    
-    return session.client('s3', endpoint_url=endpoint_url)
+    """Return this worker's S3 client for the S3_* environment variables."""
+    return storage_clients.s3()
 
 def get_filename_from_url(url):
     """Extract filename from URL."""
@@ -79,75 +71,22 @@ def stream_upload_to_s3(file_url, custom_filename=None, make_public=False, downl
         else:
             filename = get_filename_from_url(file_url)
         
-        # Start a multipart upload
-        logger.info(f"Starting multipart upload for {filename} to bucket {bucket_name}")
-        acl = 'public-read' if make_public else 'private'
-        
-        multipart_upload = s3_client.create_multipart_upload(
-            Bucket=bucket_name,
-            Key=filename,
-            ACL=acl
-        )
-        
-        upload_id = multipart_upload['UploadId']
-        
         # Stream the file from URL
-        response = requests.get(file_url, stream=True, headers=download_headers)
+        response = http_client.get(file_url, stream=True, headers=download_headers)
         response.raise_for_status()
+        size = int(response.headers.get('Content-Length', 0) or 0) or None
         
-        # Process in chunks using multipart upload
-        chunk_size = 5 * 1024 * 1024  # 5MB chunks (AWS minimum)
-        parts = []
-        part_number = 1
-        
-        buffer = bytearray()
-        
-        for chunk in response.iter_content(chunk_size=1024 * 1024):  # 1MB read chunks
-            buffer.extend(chunk)
-            
-            # When we have enough data for a part, upload it
-            if len(buffer) >= chunk_size:
-                logger.info(f"Uploading part {part_number}")
-                part = s3_client.upload_part(
-                    Bucket=bucket_name,
-                    Key=filename,
-                    PartNumber=part_number,
-                    UploadId=upload_id,
-                    Body=buffer
-                )
-                
-                parts.append({
-                    'PartNumber': part_number,
-                    'ETag': part['ETag']
-                })
-                
-                part_number += 1
-                buffer = bytearray()
-        
-        # Upload any remaining data as the final part
-        if buffer:
-            logger.info(f"Uploading final part {part_number}")
-            part = s3_client.upload_part(
-                Bucket=bucket_name,
-                Key=filename,
-                PartNumber=part_number,
-                UploadId=upload_id,
-                Body=buffer
-            )
-            
-            parts.append({
-                'PartNumber': part_number,
-                'ETag': part['ETag']
-            })
+        # Upload parts concurrently while the download continues; the
+        # multipart upload is aborted if anything fails
+        logger.info(f"Starting multipart upload for {filename} to bucket {bucket_name}")
+        acl = 'public-read' if make_public else 'private'
         
-        # Complete the multipart upload
-        logger.info("Completing multipart upload")
-        s3_client.complete_multipart_upload(
-            Bucket=bucket_name,
-            Key=filename,
-            UploadId=upload_id,
-            MultipartUpload={'Parts': parts}
-        )
+        with response, MultipartUpload(s3_client, bucket_name, filename, size=size, ACL=acl) as upload:
+            with bandwidth.transfer(file_url, size) as flow:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):  # 1MB read chunks
+                    flow.consume(len(chunk))
+                    upload.write(chunk)
+            record_stat("upload", upload.complete())
         
         # Generate the URL to the uploaded file
         if make_public:
@@ -20,23 +20,24 @@ import os
 import ffmpeg
 import requests
 from services.file_management import download_file
-from config import LOCAL_STORAGE_PATH
+from services.scratch import job_scratch_dir, job_scratch_path
 
 def process_video_concatenate(media_urls, job_id, webhook_url=None):
     """Combine multiple videos into one."""
     input_files = []
+    work_dir = job_scratch_dir()  # removed with everything in it when the job ends
     output_filename = f"{job_id}.mp4"
-    output_path = os.path.join(LOCAL_STORAGE_PATH, output_filename)
+    output_path = os.path.join(work_dir, output_filename)
 
     try:
         # Download all media files
         for i, media_item in enumerate(media_urls):
             url = media_item['video_url']
-            input_filename = download_file(url, os.path.join(LOCAL_STORAGE_PATH, f"{job_id}_input_{i}"))
+            input_filename = download_file(url, os.path.join(work_dir, f"{job_id}_input_{i}"))
             input_files.append(input_filename)
 
         # Generate an absolute path concat list file for FFmpeg
-        concat_file_path = os.path.join(LOCAL_STORAGE_PATH, f"{job_id}_concat_list.txt")
+        concat_file_path = job_scratch_path(f"{job_id}_concat_list.txt")
         with open(concat_file_path, 'w') as concat_file:
             for input_file in input_files:
                 # Write absolute paths to the concat list
@@ -24,6 +24,7 @@ import uuid
 import tempfile
 from services.file_management import download_file
 from services.cloud_storage import upload_file
+from services.scratch import job_scratch_path
 from config import LOCAL_STORAGE_PATH
 
 # Set up logging
@@ -219,7 +220,7 @@ def cut_media(video_url, cuts, job_id=None, video_codec='libx264', video_preset=
             # If we have segments to concatenate
             if segment_files:
                 # Create a concat file
-                concat_file = os.path.join(LOCAL_STORAGE_PATH, f"{job_id}_concat.txt")
+                concat_file = job_scratch_path(f"{job_id}_concat.txt")
                 temp_files.append(concat_file)
                 
                 with open(concat_file, 'w') as f:
@@ -16,17 +16,216 @@
 
 
 
-import requests
+import os
+import json
+import time
+import random
+import sqlite3
 import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from config import LOCAL_STORAGE_PATH
+from services.job_journal import process_token, owner_alive
+from services.http_client import http_client
 
 logger = logging.getLogger(__name__)
 
+# Webhooks are delivered by a dedicated thread pool from a persisted outbox
+# (LOCAL_STORAGE_PATH/jobs/webhooks.db), so a slow or dead receiver never
+# holds a job worker and undelivered results survive restarts.
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+WEBHOOK_CONNECT_TIMEOUT = float(os.environ.get('WEBHOOK_CONNECT_TIMEOUT', 5))
+WEBHOOK_READ_TIMEOUT = float(os.environ.get('WEBHOOK_READ_TIMEOUT', 30))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+WEBHOOK_BACKOFF_BASE = float(os.environ.get('WEBHOOK_BACKOFF_BASE', 2))
+WEBHOOK_BACKOFF_MAX = float(os.environ.get('WEBHOOK_BACKOFF_MAX', 600))
+# Optional: deliver all pending callbacks for the same URL as one JSON array
+WEBHOOK_BATCH = os.environ.get('WEBHOOK_BATCH', 'false').lower() in ['true', '1']
+WEBHOOK_BATCH_MAX = int(os.environ.get('WEBHOOK_BATCH_MAX', 50))
+# Longest a process that is about to exit (Cloud Run Job mode) waits for its callbacks
+WEBHOOK_FLUSH_TIMEOUT = float(os.environ.get('WEBHOOK_FLUSH_TIMEOUT', 120))
+WEBHOOK_OUTBOX_PATH = os.environ.get('WEBHOOK_OUTBOX_PATH', os.path.join(LOCAL_STORAGE_PATH, 'jobs', 'webhooks.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    owner_pid TEXT NOT NULL  -- process_token() of the delivering worker
+)
+"""
+
+
+class WebhookDispatcher:
+    """Persisted outbox drained by a thread pool over the shared HTTP client."""
+
+    def __init__(self, path=WEBHOOK_OUTBOX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._owner = None
+        self._conn = None
+        self._pool = None
+        self._in_flight = set()
+        self.delivered = 0
+        self.failed = 0
+
+    def start(self):
+        """Open the outbox and start the dispatcher once per process."""
+        # Connections, sessions and threads do not survive fork()
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            self._conn = conn
+            self._in_flight = set()
+            self._pool = ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS, thread_name_prefix="webhook")
+            self._pid = os.getpid()
+            self._owner = process_token()
+            # Adopt callbacks left behind by worker processes that are gone
+            owners = [row[0] for row in self._conn.execute("SELECT DISTINCT owner_pid FROM outbox")]
+            for owner_pid in owners:
+                if not owner_alive(owner_pid):
+                    self._conn.execute("UPDATE outbox SET owner_pid=? WHERE owner_pid=?", (self._owner, owner_pid))
+            threading.Thread(target=self._dispatch_loop, name="webhook-dispatcher", daemon=True).start()
+
+    def enqueue(self, url, data):
+        """Persist a callback and wake the dispatcher."""
+        self.start()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (url, payload, attempts, next_attempt_at, owner_pid) VALUES (?, ?, 0, ?, ?)",
+                (url, json.dumps(data), time.time(), self._owner)
+            )
+        self._wakeup.set()
+
+    def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                delay = self._dispatch_due()
+            except Exception as e:
+                logger.error(f"Webhook dispatcher error: {e}")
+                delay = 5
+            self._wakeup.wait(delay)
+
+    def _dispatch_due(self):
+        """Submit every due callback; returns seconds until the next one is due."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, url, payload, attempts FROM outbox WHERE owner_pid=? AND next_attempt_at <= ? "
+                "ORDER BY id",
+                (self._owner, now)
+            ).fetchall()
+            upcoming = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE owner_pid=? AND next_attempt_at > ?",
+                (self._owner, now)
+            ).fetchone()[0]
+            rows = [row for row in rows if row[0] not in self._in_flight]
+            self._in_flight.update(row[0] for row in rows)
+        if WEBHOOK_BATCH:
+            by_url = {}
+            for row in rows:
+                by_url.setdefault(row[1], []).append(row)
+            groups = [
+                group[i:i + WEBHOOK_BATCH_MAX]
+                for group in by_url.values()
+                for i in range(0, len(group), WEBHOOK_BATCH_MAX)
+            ]
+        else:
+            groups = [[row] for row in rows]
+
+        for group in groups:
+            self._pool.submit(self._deliver, group)
+
+        return max(0.5, min(upcoming - now, 60)) if upcoming else 60
+
+    def _deliver(self, rows):
+        url = rows[0][1]
+        ids = [row[0] for row in rows]
+        payloads = [json.loads(row[2]) for row in rows]
+        body = payloads if WEBHOOK_BATCH else payloads[0]
+        attempts = max(row[3] for row in rows) + 1
+        try:
+            logger.info(f"Attempting to send webhook to {url} ({len(payloads)} callback(s), attempt {attempts})")
+            response = http_client.post(
+                url, json=body, timeout=(WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT)
+            )
+            response.raise_for_status()
+            logger.info(f"Webhook sent to {url}")
+            with self._lock:
+                self._conn.executemany("DELETE FROM outbox WHERE id=?", [(i,) for i in ids])
+                self.delivered += len(ids)
+        except requests.RequestException as e:
+            status = getattr(e.response, 'status_code', None)
+            retryable = status is None or status == 429 or status >= 500
+            with self._lock:
+                if retryable and attempts < WEBHOOK_MAX_ATTEMPTS:
+                    backoff = min(WEBHOOK_BACKOFF_BASE ** attempts, WEBHOOK_BACKOFF_MAX)
+                    backoff *= random.uniform(0.8, 1.2)
+                    logger.warning(f"Webhook to {url} failed ({e}), retrying in {backoff:.1f}s")
+                    self._conn.executemany(
+                        "UPDATE outbox SET attempts=?, next_attempt_at=? WHERE id=?",
+                        [(attempts, time.time() + backoff, i) for i in ids]
+                    )
+                else:
+                    logger.error(f"Webhook failed: {e}")
+                    self._conn.executemany("DELETE FROM outbox WHERE id=?", [(i,) for i in ids])
+                    self.failed += len(ids)
+        finally:
+            with self._lock:
+                self._in_flight.difference_update(ids)
+            self._wakeup.set()
+
+    def flush(self, timeout=WEBHOOK_FLUSH_TIMEOUT):
+        """Wait until this process's callbacks are delivered or given up.
+
+        Returns:
+            int: callbacks still pending after ``timeout`` seconds
+        """
+        self.start()
+        deadline = time.time() + timeout
+        while True:
+            with self._lock:
+                pending = self._conn.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE owner_pid=?", (self._owner,)
+                ).fetchone()[0]
+            if not pending or time.time() >= deadline:
+                if pending:
+                    logger.warning(f"Webhook flush timed out with {pending} callback(s) pending")
+                return pending
+            self._wakeup.set()
+            time.sleep(0.1)
+
+    def stats(self):
+        self.start()
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            return {
+                "pending": pending,
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "batching": WEBHOOK_BATCH
+            }
+
+
+webhook_dispatcher = WebhookDispatcher()
+
+
 def send_webhook(webhook_url, data):
-    """Send a POST request to a webhook URL with the provided data."""
+    """Queue a POST of ``data`` to a webhook URL for asynchronous delivery."""
     try:
-        logger.info(f"Attempting to send webhook to {webhook_url} with data: {data}")
-        response = requests.post(webhook_url, json=data)
-        response.raise_for_status()
-        logger.info(f"Webhook sent: {data}")
-    except requests.RequestException as e:
+        webhook_dispatcher.enqueue(webhook_url, data)
+    except Exception as e:
         logger.error(f"Webhook failed: {e}")